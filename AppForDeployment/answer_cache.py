@@ -0,0 +1,164 @@
+"""
+Cache of final chat answers for repeated questions.
+
+Answers are keyed by the user, the normalized conversation, the version of
+the user's data and the model. Answers built on a tool result that read
+the clock or drew random numbers are not stored. The store is pluggable: `MemoryAnswerStore`
+lives in the process, `SqliteAnswerStore` is a local file that every uvicorn
+worker on the host can share. ANSWER_CACHE_BACKEND selects one of them
+("memory", "sqlite" or "none").
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import ANSWER_CACHE_LOOKUPS
+
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite3")
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_conversation(conversation_history: list) -> list:
+    """
+    Messages with whitespace differences folded away. Case is kept: the data
+    is case-sensitive, so "SKU1" and "sku1" are different questions.
+    """
+    return [
+        [message["role"], _WHITESPACE.sub(" ", message["content"] or "").strip()]
+        for message in conversation_history
+    ]
+
+
+class MemoryAnswerStore:
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (user_id, answer, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, max_age: float):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[2] > max_age:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, user_id: str, answer: dict):
+        with self._lock:
+            self._entries[key] = (user_id, answer, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str = None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                return
+            for key in [k for k, entry in self._entries.items() if entry[0] == user_id]:
+                del self._entries[key]
+
+
+class SqliteAnswerStore:
+    """Answers in a SQLite file; safe to share between processes."""
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, user_id TEXT, answer TEXT, stored_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_user ON answers (user_id)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key: str, max_age: float):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT answer FROM answers WHERE key = ? AND stored_at >= ?",
+                (key, time.time() - max_age),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, user_id: str, answer: dict):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)",
+                (key, user_id, json.dumps(answer), time.time()),
+            )
+            conn.execute(
+                "DELETE FROM answers WHERE key NOT IN "
+                "(SELECT key FROM answers ORDER BY stored_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, user_id: str = None):
+        with self._connect() as conn:
+            if user_id is None:
+                conn.execute("DELETE FROM answers")
+            else:
+                conn.execute("DELETE FROM answers WHERE user_id = ?", (user_id,))
+
+
+class AnswerCache:
+    def __init__(self, store, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def key(user_id: str, conversation_history: list, data_version: str, model: str) -> str:
+        payload = json.dumps(
+            [user_id, normalize_conversation(conversation_history), data_version, model]
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str):
+        answer = None if self.store is None else self.store.get(key, self.ttl_seconds)
+        ANSWER_CACHE_LOOKUPS.inc(outcome="miss" if answer is None else "hit")
+        return answer
+
+    def put(self, key: str, user_id: str, answer: dict):
+        if self.store is not None:
+            self.store.put(key, user_id, answer)
+
+    def invalidate(self, user_id: str = None):
+        if self.store is not None:
+            self.store.invalidate(user_id)
+
+    def stats(self) -> dict:
+        lookups = {dict(labels)["outcome"]: n for labels, n in ANSWER_CACHE_LOOKUPS.values().items()}
+        hits, misses = lookups.get("hit", 0), lookups.get("miss", 0)
+        return {
+            "backend": type(self.store).__name__ if self.store is not None else None,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+
+def make_answer_cache(backend: str = ANSWER_CACHE_BACKEND) -> AnswerCache:
+    stores = {
+        "memory": MemoryAnswerStore,
+        "sqlite": SqliteAnswerStore,
+        "none": lambda: None,
+    }
+    if backend not in stores:
+        raise ValueError(f"Unknown ANSWER_CACHE_BACKEND {backend!r}")
+    return AnswerCache(stores[backend]())
@@ -0,0 +1,86 @@
+"""
+Compare flatten_records with the per-record flatten_json path on synthetic
+gateway payloads.
+
+    python benchmarks/bench_flatten.py --records 20000 --lines 8
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+from data_fetching import flatten_json  # noqa: E402
+from flattening import flatten_records  # noqa: E402
+
+
+def make_records(n_records: int, max_lines: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    records = []
+    for i in range(n_records):
+        record = {
+            "_id": f"{i:024x}",
+            "number": i,
+            "status": rng.choice(["draft", "paid", "cancelled", None]),
+            "client": {"_id": f"c{rng.randrange(500)}", "name": f"client {i % 97}"},
+            "total": round(rng.uniform(0, 10_000), 2),
+            "tags": rng.sample(["a", "b", "c", "d"], rng.randrange(3)),
+            "lines": [
+                {
+                    "item": {"_id": f"i{rng.randrange(2000)}", "sku": f"SKU{j}"},
+                    "qty": rng.randrange(1, 50),
+                    "price": rng.uniform(1, 300),
+                }
+                for j in range(rng.randrange(max_lines + 1))
+            ],
+        }
+        if rng.random() < 0.3:
+            record["discount"] = {"rate": rng.random(), "code": None}
+        records.append(record)
+    return records
+
+
+def legacy(records: list) -> pd.DataFrame:
+    return pd.DataFrame([flatten_json(record) for record in records]).dropna(
+        axis=1, how="all"
+    )
+
+
+def columnar(records: list) -> pd.DataFrame:
+    return flatten_records(records).dropna(axis=1, how="all")
+
+
+def best_of(fn, records: list, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(records)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--lines", type=int, default=8, help="max line items per record")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    records = make_records(args.records, args.lines)
+    pd.testing.assert_frame_equal(legacy(records), columnar(records))
+
+    legacy_s = best_of(legacy, records, args.repeat)
+    columnar_s = best_of(columnar, records, args.repeat)
+    print(f"records: {args.records}  columns: {columnar(records).shape[1]}")
+    print(f"flatten_json + DataFrame : {legacy_s * 1000:8.1f} ms")
+    print(f"flatten_records          : {columnar_s * 1000:8.1f} ms")
+    print(f"speed-up                 : {legacy_s / columnar_s:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+End-to-end load benchmark of POST /chat.
+
+Starts the fake gateway, the fake OpenAI server and the API (uvicorn) on
+local ports, syncs each benchmark user once, then sends /chat requests at
+the target concurrency and reports latency percentiles, throughput and the
+time spent per pipeline stage, read from the /metrics of the API.
+
+    python benchmarks/bench_load.py --requests 200 --concurrency 16 --users 4
+    python benchmarks/bench_load.py --url http://127.0.0.1:8000 --requests 50
+
+With --url, the servers are not started and the running API is driven as is.
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+_STAGE_LINE = re.compile(r'^supplyz_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, timeout: float = 120):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(url)
+
+
+def _start(stack: ExitStack, args: list, cwd: str, env: dict = None) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, *args],
+        cwd=cwd,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    def stop():
+        process.terminate()
+        process.wait()
+
+    stack.callback(stop)
+    return process
+
+
+def start_servers(stack: ExitStack, args, workdir: str) -> str:
+    """Start the fake gateway, the fake OpenAI server and the API; return the API URL."""
+    gateway_port, openai_port, api_port = _free_port(), _free_port(), _free_port()
+    gateway_args = [
+        os.path.join(BENCH_DIR, "fake_gateway.py"),
+        *("--port", str(gateway_port), "--records", str(args.records)),
+        *("--depth", str(args.depth), "--lines", str(args.lines)),
+        *("--latency", str(args.gateway_latency)),
+    ]
+    _start(stack, gateway_args, workdir)
+    openai_args = [
+        os.path.join(BENCH_DIR, "fake_openai.py"),
+        *("--port", str(openai_port), "--ttft", str(args.ttft)),
+        *("--chunk-delay", str(args.chunk_delay)),
+    ]
+    if args.script:
+        openai_args += ["--script", os.path.abspath(args.script)]
+    _start(stack, openai_args, workdir)
+    _wait_for(f"http://127.0.0.1:{gateway_port}/stats")
+    _wait_for(f"http://127.0.0.1:{openai_port}/stats")
+    _start(
+        stack,
+        ["-m", "uvicorn", "main:app", "--app-dir", APP_DIR, "--port", str(api_port)],
+        workdir,
+        {
+            "GATEWAY_URL": f"http://127.0.0.1:{gateway_port}",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+            "OPENAI_API_KEY": "bench",
+            "DATA_ROOT": os.path.join(workdir, "workspaces"),
+        },
+    )
+    api_url = f"http://127.0.0.1:{api_port}"
+    _wait_for(f"{api_url}/ready")
+    return api_url
+
+
+def stage_totals(api_url: str) -> dict:
+    """``{stage: [count, seconds]}`` from the API's /metrics."""
+    totals = {}
+    for line in httpx.get(f"{api_url}/metrics").text.splitlines():
+        match = _STAGE_LINE.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            totals.setdefault(stage, [0, 0.0])[0 if kind == "count" else 1] = float(value)
+    return totals
+
+
+def _payload(user_id: str, question: str) -> dict:
+    return {"user_id": user_id, "conversation_history": [{"role": "user", "content": question}]}
+
+
+async def run_load(api_url: str, users: list, n_requests: int, concurrency: int, distinct: bool):
+    """Send `n_requests` /chat requests, `concurrency` at a time; return latencies and errors."""
+    latencies, errors = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=api_url, timeout=300, limits=limits) as client:
+
+        async def one(i: int):
+            question = "What is the stock value per category?"
+            if distinct:
+                question += f" (#{i})"
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    resp = await client.post("/chat", json=_payload(users[i % len(users)], question))
+                    resp.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError as e:
+                    errors.append(str(e) or type(e).__name__)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def report(latencies: list, errors: list, elapsed: float, before: dict, after: dict):
+    print(f"requests : {len(latencies)} ok, {len(errors)} failed in {elapsed:.2f} s")
+    print(f"throughput: {len(latencies) / elapsed:8.2f} req/s")
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100)
+        for name, value in (("p50", cuts[49]), ("p95", cuts[94]), ("p99", cuts[98])):
+            print(f"  {name:<8}: {value * 1000:8.0f} ms")
+    if errors:
+        print(f"first error: {errors[0]}")
+    total_seconds = sum(latencies) or 1
+    print("per stage (during the load):")
+    print(f"  {'stage':<14}{'calls':>8}{'total s':>10}{'mean ms':>10}{'% of latency':>14}")
+    for stage in sorted(after):
+        count = after[stage][0] - before.get(stage, [0, 0.0])[0]
+        seconds = after[stage][1] - before.get(stage, [0, 0.0])[1]
+        if count:
+            print(
+                f"  {stage:<14}{count:>8.0f}{seconds:>10.2f}{seconds / count * 1000:>10.1f}"
+                f"{seconds / total_seconds * 100:>13.1f}%"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="drive a running API instead of starting the servers")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument(
+        "--repeat", action="store_true", help="send the same question every time (answer cache hits)"
+    )
+    parser.add_argument("--records", type=int, default=1000, help="fake gateway: invoices and purchases")
+    parser.add_argument("--depth", type=int, default=2, help="fake gateway: nesting depth")
+    parser.add_argument("--lines", type=int, default=5, help="fake gateway: max lines per record")
+    parser.add_argument("--gateway-latency", type=float, default=0.0, help="fake gateway: seconds per table")
+    parser.add_argument("--script", help="fake OpenAI: JSON file with the scripted steps")
+    parser.add_argument("--ttft", type=float, default=0.3, help="fake OpenAI: seconds to first chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="fake OpenAI: seconds between chunks")
+    args = parser.parse_args()
+
+    users = [f"bench{i}" for i in range(args.users)]
+    with ExitStack() as stack:
+        api_url = args.url
+        if api_url is None:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory())
+            api_url = start_servers(stack, args, workdir)
+        started = time.perf_counter()
+        for user_id in users:
+            # The first request of a user waits for its first sync
+            httpx.post(f"{api_url}/chat", json=_payload(user_id, "warm up"), timeout=600).raise_for_status()
+        print(f"warm-up  : {len(users)} users synced in {time.perf_counter() - started:.2f} s")
+
+        before = stage_totals(api_url)
+        latencies, errors, elapsed = asyncio.run(
+            run_load(api_url, users, args.requests, args.concurrency, not args.repeat)
+        )
+        report(latencies, errors, elapsed, before, stage_totals(api_url))
+
+
+if __name__ == "__main__":
+    main()
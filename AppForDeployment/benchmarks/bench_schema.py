@@ -0,0 +1,106 @@
+"""
+Measure the system prompt size with the old dtype-dict table signatures and
+with compact_schema.
+
+    python benchmarks/bench_schema.py --data-dir workspaces/<user_id>/data
+    python benchmarks/bench_schema.py --records 2000 --lines 8
+
+Without --data-dir, synthetic gateway payloads are used, in both the wide
+flatten_json layout and the normalized child-table layout. Tokens are
+counted with tiktoken when it is installed, otherwise estimated as 4
+characters per token.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+from bench_flatten import make_records  # noqa: E402
+from configs import SYSTEM_PROMPT, TABLES_DEFINITIONS  # noqa: E402
+from data_fetching import TABLE_NAMES, flatten_json, get_data  # noqa: E402
+from flattening import normalize_records  # noqa: E402
+from schema import compact_schema  # noqa: E402
+from views import VIEWS  # noqa: E402
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+
+    TOKENIZER = "tiktoken o200k_base"
+except ImportError:
+
+    def count_tokens(text: str) -> int:
+        return len(text) // 4
+
+    TOKENIZER = "estimate (4 chars/token)"
+
+
+def build_prompt(tables: dict, signature) -> str:
+    signatures = {name: signature(df) for name, df in tables.items()}
+    children = [name for name in tables if name not in TABLE_NAMES and name not in VIEWS]
+    return SYSTEM_PROMPT.format(
+        TABLES_DEFINITIONS=TABLES_DEFINITIONS.format(
+            clients_mapping=signatures.get("clients", ""),
+            items_mapping=signatures.get("items", ""),
+            suppleirs_mapping=signatures.get("suppliers", ""),
+            purrchases_mapping=signatures.get("purchases", ""),
+            invoices_mapping=signatures.get("invoices", ""),
+            child_tables_mapping="\n\n".join(
+                f"{name} :\n{signatures[name]}" for name in children
+            )
+            or "None",
+            views_mapping="\n\n".join(
+                f"{name} :\n{signatures[name]}" for name in VIEWS if name in signatures
+            )
+            or "None",
+            rollups_mapping="None",
+        )
+    )
+
+
+def report(label: str, tables: dict):
+    before = build_prompt(tables, lambda df: str(df.dtypes.to_dict()))
+    after = build_prompt(tables, compact_schema)
+    n_before, n_after = count_tokens(before), count_tokens(after)
+    schema_before = sum(count_tokens(str(df.dtypes.to_dict())) for df in tables.values())
+    schema_after = sum(count_tokens(compact_schema(df)) for df in tables.values())
+    n_columns = sum(df.shape[1] for df in tables.values())
+    print(f"{label}  ({len(tables)} tables, {n_columns} columns)")
+    print("                   schemas    prompt")
+    print(f"  dtype dicts    : {schema_before:7,} {n_before:9,} tokens")
+    print(f"  compact_schema : {schema_after:7,} {n_after:9,} tokens")
+    print(f"  saved per LLM call: {n_before - n_after:,} tokens ({1 - n_after / n_before:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--data-dir", help="a synced workspace data directory")
+    parser.add_argument("--records", type=int, default=2_000)
+    parser.add_argument("--lines", type=int, default=8, help="max line items per record")
+    args = parser.parse_args()
+
+    print(f"tokenizer: {TOKENIZER}")
+    if args.data_dir:
+        report(args.data_dir, {name: table[0] for name, table in get_data(args.data_dir).items()})
+        return
+
+    records = make_records(args.records, args.lines)
+    wide = pd.DataFrame([flatten_json(record) for record in records]).dropna(axis=1, how="all")
+    report("synthetic invoices, flatten_json columns", {"invoices": wide})
+    normalized = {
+        name: df.dropna(axis=1, how="all")
+        for name, df in normalize_records("invoices", records).items()
+    }
+    report("synthetic invoices, child tables", normalized)
+
+
+if __name__ == "__main__":
+    main()
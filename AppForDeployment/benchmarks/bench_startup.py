@@ -0,0 +1,91 @@
+"""
+Measure how fast the API starts: the import time of main (what runs before
+uvicorn can serve /ping), the import time of the chat service (what /ping
+used to wait for) and, with a real uvicorn process, the time until /ping
+and /ready answer.
+
+    python benchmarks/bench_startup.py --runs 3
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_seconds(module: str, cwd: str) -> float:
+    code = (
+        "import time; started = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - started)"
+    )
+    env = {**os.environ, "PYTHONPATH": APP_DIR}
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, started: float, timeout: float) -> float:
+    while time.perf_counter() - started < timeout:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - started
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(url)
+
+
+def server_seconds(cwd: str, timeout: float = 60) -> tuple:
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", APP_DIR, "--port", str(port)],
+        cwd=cwd,
+        env={**os.environ, "DATA_ROOT": os.path.join(cwd, "workspaces")},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        ping = _wait_for(f"http://127.0.0.1:{port}/ping", started, timeout)
+        ready = _wait_for(f"http://127.0.0.1:{port}/ready", started, timeout)
+        return ping, ready
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cwd:
+        results = {"import main": [], "import chat_service": [], "/ping": [], "/ready": []}
+        for _ in range(args.runs):
+            results["import main"].append(import_seconds("main", cwd))
+            results["import chat_service"].append(import_seconds("chat_service", cwd))
+            ping, ready = server_seconds(cwd)
+            results["/ping"].append(ping)
+            results["/ready"].append(ready)
+    print(f"median of {args.runs} runs (from process start for /ping and /ready)")
+    for name, timings in results.items():
+        print(f"  {name:<20}: {statistics.median(timings) * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Local stand-in for the supplyz gateway, serving synthetic tables.
+
+It answers the auth endpoint and the five table endpoints with generated
+records whose size and nesting depth are configurable, and honours
+If-None-Match so incremental syncs get 304s. Every record carries an
+updated_at; with updated_since, only the records updated at or after it are
+sent (an inclusive filter, as the boundary case of a delta sync), unless
+--ignore-updated-since makes it send the full table like a gateway without
+delta support. POST /tables/<name> adds or replaces a record (by _id) and
+stamps its updated_at. Point the API at it with GATEWAY_URL.
+
+    python benchmarks/fake_gateway.py --port 8001 --records 5000 --depth 3
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import time
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+
+TABLE_PATHS = {
+    "clients": "/orders_service/ai/v1/clients",
+    "invoices": "/orders_service/ai/v1/invoices",
+    "items": "/inventory/ai/v1/items",
+    "purchases": "/inventory/ai/v1/purchases",
+    "suppliers": "/inventory/ai/v1/suppliers",
+}
+AUTH_PATH = "/user_management_service/ai/v1/auth"
+
+
+def _nested(rng: random.Random, depth: int) -> dict:
+    """`depth` levels of nested objects, as found in address or metadata fields."""
+    value = {"code": f"c{rng.randrange(100)}", "score": round(rng.random(), 3)}
+    for level in range(depth, 0, -1):
+        value = {f"level_{level}": value, "note": rng.choice(["a", "b", None])}
+    return value
+
+
+def _lines(rng: random.Random, n_items: int, max_lines: int) -> list:
+    return [
+        {
+            "item": {"_id": f"item{rng.randrange(n_items)}", "name": f"item {rng.randrange(n_items)}"},
+            "quantity": rng.randrange(1, 50),
+            "price": round(rng.uniform(1, 300), 2),
+        }
+        for _ in range(rng.randrange(max_lines + 1))
+    ]
+
+
+def make_tables(records: int, depth: int, max_lines: int, seed: int = 0) -> dict:
+    """Synthetic records per table: `records` invoices and purchases, a tenth as many of the rest."""
+    rng = random.Random(seed)
+    n_master = max(10, records // 10)
+    months = [f"2024-{month:02d}-{day:02d}T10:00:00Z" for month in range(1, 13) for day in (1, 15)]
+    suppliers = [
+        {
+            "_id": f"supplier{i}",
+            "name": f"supplier {i}",
+            "category": rng.choice(["food", "tools", "paper"]),
+            "address": _nested(rng, depth),
+            "updated_at": rng.choice(months),
+        }
+        for i in range(n_master)
+    ]
+    clients = [
+        {
+            "_id": f"client{i}",
+            "name": f"client {i}",
+            "email": f"client{i}@example.com",
+            "address": _nested(rng, depth),
+            "updated_at": rng.choice(months),
+        }
+        for i in range(n_master)
+    ]
+    items = [
+        {
+            "_id": f"item{i}",
+            "name": f"item {i}",
+            "sku": f"SKU{i}",
+            "category": rng.choice(["food", "tools", "paper", "drinks"]),
+            "quantity": rng.randrange(0, 500),
+            "price": round(rng.uniform(1, 300), 2),
+            "supplier": {"_id": f"supplier{rng.randrange(n_master)}"},
+            "meta": _nested(rng, depth),
+            "updated_at": rng.choice(months),
+        }
+        for i in range(n_master)
+    ]
+    invoices = [
+        {
+            "_id": f"invoice{i}",
+            "number": i,
+            "date": rng.choice(months),
+            "status": rng.choice(["draft", "paid", "cancelled"]),
+            "client": {"_id": f"client{rng.randrange(n_master)}", "name": f"client {i % n_master}"},
+            "total": round(rng.uniform(0, 10_000), 2),
+            "lines": _lines(rng, n_master, max_lines),
+            "meta": _nested(rng, depth),
+            "updated_at": rng.choice(months),
+        }
+        for i in range(records)
+    ]
+    purchases = [
+        {
+            "_id": f"purchase{i}",
+            "date": rng.choice(months),
+            "supplier": {"_id": f"supplier{rng.randrange(n_master)}"},
+            "total": round(rng.uniform(0, 10_000), 2),
+            "lines": _lines(rng, n_master, max_lines),
+            "meta": _nested(rng, depth),
+            "updated_at": rng.choice(months),
+        }
+        for i in range(records)
+    ]
+    return {
+        "clients": clients,
+        "invoices": invoices,
+        "items": items,
+        "purchases": purchases,
+        "suppliers": suppliers,
+    }
+
+
+def create_app(
+    records: int = 1000,
+    depth: int = 2,
+    max_lines: int = 5,
+    latency: float = 0.0,
+    honour_updated_since: bool = True,
+) -> FastAPI:
+    app = FastAPI()
+    tables = app.state.tables = make_tables(records, depth, max_lines)
+    # Serialized once per version: the gateway itself should not be the bottleneck
+    bodies, etags = {}, {}
+    app.state.requests = {"auth": 0, "tables": 0, "not_modified": 0, "deltas": 0}
+
+    def full_body(name: str):
+        if name not in bodies:
+            bodies[name] = json.dumps({"data": tables[name]}).encode()
+            etags[name] = f'"{hashlib.sha1(bodies[name]).hexdigest()}"'
+        return bodies[name], etags[name]
+
+    @app.get(AUTH_PATH)
+    def auth(user_id: str):
+        app.state.requests["auth"] += 1
+        return {"token": f"token-{user_id}"}
+
+    def table_endpoint(name: str):
+        def endpoint(request: Request, updated_since: Optional[str] = None):
+            time.sleep(latency)
+            body, etag = full_body(name)
+            if request.headers.get("if-none-match") == etag:
+                app.state.requests["not_modified"] += 1
+                return Response(status_code=304)
+            app.state.requests["tables"] += 1
+            if updated_since is not None and honour_updated_since:
+                app.state.requests["deltas"] += 1
+                rows = [row for row in tables[name] if row["updated_at"] >= updated_since]
+                body = json.dumps({"data": rows}).encode()
+            return Response(body, media_type="application/json", headers={"ETag": etag})
+        return endpoint
+
+    for name, path in TABLE_PATHS.items():
+        app.add_api_route(path, table_endpoint(name), methods=["GET"])
+
+    @app.post("/tables/{name}")
+    def upsert_record(name: str, record: dict):
+        if name not in tables:
+            raise HTTPException(404, f"Unknown table: {name}")
+        record = {**record, "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+        rows = [row for row in tables[name] if row["_id"] != record["_id"]]
+        tables[name] = rows + [record]
+        bodies.pop(name, None)
+        return record
+
+    @app.get("/stats")
+    def stats():
+        return app.state.requests
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--records", type=int, default=1000, help="invoices and purchases per table")
+    parser.add_argument("--depth", type=int, default=2, help="nesting depth of the object fields")
+    parser.add_argument("--lines", type=int, default=5, help="max lines per invoice and purchase")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to each table response")
+    parser.add_argument(
+        "--ignore-updated-since", action="store_true", help="always send the full table"
+    )
+    args = parser.parse_args()
+    app = create_app(
+        args.records, args.depth, args.lines, args.latency, not args.ignore_updated_since
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
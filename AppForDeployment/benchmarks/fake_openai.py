@@ -0,0 +1,188 @@
+"""
+Local OpenAI-compatible server that replays a scripted tool-call sequence.
+
+POST /v1/chat/completions answers every conversation with the same script:
+step N is played when the request holds N tool-calling assistant turns since
+the last user message, so the server keeps no state. A step is a tool call
+({"tool", "arguments"}), several parallel ones ({"tool_calls": [...]}) or
+the final answer ({"content"}). It is streamed (or returned whole) after a
+configurable time to first token and per-chunk delay, which a step can
+override with its own "ttft" and "chunk_delay". Point the API at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+"{request}" in a scripted tool argument is replaced with a digest of the
+first user message, so distinct questions run distinct code and miss the
+result cache while repeated questions hit it.
+
+    python benchmarks/fake_openai.py --port 8002 --ttft 0.4 --chunk-delay 0.02
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+QUERY_CALL = {
+    "tool": "QueryAnalysisOutput",
+    "arguments": {
+        "table_name": "invoices",
+        "group_by": ["status"],
+        "aggregations": {"total": "sum", "_id": "count"},
+    },
+}
+CODE_CALL = {
+    "tool": "InventoryCodeInterpreter",
+    "arguments": {
+        "python_code": (
+            "request = '{request}'\n"
+            "items = load_table('items', columns=['category', 'quantity', 'price'])\n"
+            "items['value'] = items['quantity'] * items['price']\n"
+            "print(items.groupby('category', observed=True)['value'].sum().round(2))"
+        )
+    },
+}
+# Two independent analyses requested in the same turn, then the answer
+DEFAULT_SCRIPT = [
+    {"tool_calls": [QUERY_CALL, CODE_CALL]},
+    {"content": "Here is the summary of the invoices and of the stock value per category."},
+]
+CHUNK_CHARS = 16
+
+
+def _pieces(text: str) -> list:
+    return [text[i : i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)]
+
+
+def _request_digest(messages: list) -> str:
+    first_user = next((m.get("content") or "" for m in messages if m.get("role") == "user"), "")
+    return hashlib.sha1(first_user.encode()).hexdigest()[:12]
+
+
+def _step_index(messages: list) -> int:
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    return sum(
+        1 for m in messages[last_user + 1 :] if m.get("role") == "assistant" and m.get("tool_calls")
+    )
+
+
+def _usage(messages: list, completion: str) -> dict:
+    prompt_tokens = len(json.dumps(messages)) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": max(1, len(completion) // 4),
+        "total_tokens": prompt_tokens + max(1, len(completion) // 4),
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None, usage=None) -> str:
+    body = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        "usage": usage,
+    }
+    return f"data: {json.dumps(body)}\n\n"
+
+
+def create_app(script: list = None, ttft: float = 0.3, chunk_delay: float = 0.01) -> FastAPI:
+    script = script or DEFAULT_SCRIPT
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        messages = body.get("messages", [])
+        step = script[min(_step_index(messages), len(script) - 1)]
+        model = body.get("model", "gpt-4o")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        calls = []
+        for call in step.get("tool_calls", [step] if "tool" in step else []):
+            arguments = json.dumps(call["arguments"]).replace("{request}", _request_digest(messages))
+            calls.append(
+                {
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": call["tool"], "arguments": arguments},
+                }
+            )
+        text = "".join(call["function"]["arguments"] for call in calls) or step["content"]
+        finish_reason = "tool_calls" if calls else "stop"
+        pieces = _pieces(text)
+        # A step may override the delays, e.g. a slow final answer
+        step_ttft = step.get("ttft", ttft)
+        step_chunk_delay = step.get("chunk_delay", chunk_delay)
+        usage = _usage(messages, text)
+
+        if not body.get("stream"):
+            await asyncio.sleep(step_ttft + step_chunk_delay * len(pieces))
+            message = {"role": "assistant", "content": None if calls else text}
+            if calls:
+                message["tool_calls"] = calls
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+
+        async def stream():
+            await asyncio.sleep(step_ttft)
+            for index, call in enumerate(calls):
+                function = call["function"]
+                first = {**call, "index": index, "function": {**function, "arguments": ""}}
+                yield _chunk(completion_id, model, {"role": "assistant", "tool_calls": [first]})
+                for piece in _pieces(function["arguments"]):
+                    await asyncio.sleep(step_chunk_delay)
+                    delta = {"tool_calls": [{"index": index, "function": {"arguments": piece}}]}
+                    yield _chunk(completion_id, model, delta)
+            if not calls:
+                for piece in pieces:
+                    await asyncio.sleep(step_chunk_delay)
+                    yield _chunk(completion_id, model, {"content": piece})
+            yield _chunk(completion_id, model, {}, finish_reason)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield _chunk(completion_id, model, {}, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    def stats():
+        return {"calls": app.state.calls}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument(
+        "--script", help="JSON file with the list of steps (default: a query and some code, then an answer)"
+    )
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds before the first chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="seconds between chunks")
+    args = parser.parse_args()
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    app = create_app(script, args.ttft, args.chunk_delay)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Chat tool loop behind the API: per-user datasets, the OpenAI client, tools
+and caches. It pulls in pandas, openai and the data layer, so main.py
+imports it in the background at startup instead of before serving /ping.
+"""
+
+import asyncio
+import os
+import time
+from typing import List
+from openai import AsyncOpenAI
+from data_fetching import (
+    update_data,
+    get_data,
+    user_workspace,
+    current_data_dir,
+    format_child_tables,
+    data_version,
+    memory_report,
+)
+from configs import SYSTEM_PROMPT, TABLES_DEFINITIONS
+from views import format_views
+from rollups import format_rollups
+from functions import (
+    TOOL_CLASSES,
+    InventoryCodeInterpreter,
+    QueryAnalysisOutput,
+    SQLAnalysis,
+    parse_tool_call,
+    tool_arguments,
+)
+from dataset_cache import DatasetCache, DatasetEntry
+from refresh import RefreshScheduler
+from answer_cache import make_answer_cache
+from result_cache import is_volatile_code, is_volatile_sql
+from context_budget import compact_messages, tool_result_content
+from sandbox import SANDBOX_POOL_SIZE, TABLES_DIR, get_pool
+from metrics import STAGE_SECONDS, record_llm_usage, usage_to_dict
+
+
+# Config
+OPENAI_MODEL = "gpt-4o"
+MAX_FUNCTION_CALL_ITERATIONS = 10
+# In-flight OpenAI calls and sandbox runs across all requests of this worker
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))
+SANDBOX_CONCURRENCY = int(os.getenv("SANDBOX_CONCURRENCY", str(SANDBOX_POOL_SIZE)))
+# Tool calls of one model turn run concurrently, at most this many per request
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", "4"))
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": tool.__doc__,
+            "parameters": tool.schema(),
+        },
+    }
+    for name, tool in TOOL_CLASSES.items()
+]
+client = None
+
+def build_dataset(data_dir: str) -> DatasetEntry:
+    data = get_data(data_dir)
+
+    # Extract signatures from the fetched data
+    invoices_sig = data["invoices"][1]
+    items_sig = data["items"][1]
+    purchases_sig = data["purchases"][1]
+    suppliers_sig = data["suppliers"][1]
+    clients_sig = data["clients"][1]
+
+    # Build the system prompt using the provided configurations
+    instructions = SYSTEM_PROMPT.format(
+        TABLES_DEFINITIONS=TABLES_DEFINITIONS.format(
+            clients_mapping=clients_sig,
+            items_mapping=items_sig,
+            suppleirs_mapping=suppliers_sig,
+            purrchases_mapping=purchases_sig,
+            invoices_mapping=invoices_sig,
+            child_tables_mapping=format_child_tables(data),
+            views_mapping=format_views(data),
+            rollups_mapping=format_rollups(data),
+        )
+    )
+    # The sandbox runs in the snapshot directory, which is never modified
+    return DatasetEntry(data, instructions, os.path.dirname(data_dir), data_version(data_dir))
+
+
+def refresh_dataset(user_id: str) -> DatasetEntry:
+    """Sync the user's tables and serve the new snapshot to the next requests."""
+    data_dir = update_data(user_id)
+    entry = dataset_cache.peek(user_id)
+    if entry is None or entry.workspace != os.path.dirname(data_dir):
+        entry = build_dataset(data_dir)
+        dataset_cache.put(user_id, entry)
+    return entry
+
+
+def load_dataset(user_id: str) -> DatasetEntry:
+    """Load the last published snapshot; only a user never synced waits for a sync."""
+    data_dir = current_data_dir(user_id)
+    if data_dir is None:
+        return refresher.submit(user_id).result()
+    refresher.touch(user_id, last_refresh=os.path.getmtime(data_dir))
+    return build_dataset(data_dir)
+
+
+def current_dataset(user_id: str) -> DatasetEntry:
+    """
+    The cached dataset of `user_id`, reloaded when another worker published a
+    newer snapshot, so that replaced snapshots stop being read and can be pruned.
+    """
+    entry = dataset_cache.get(user_id)
+    data_dir = current_data_dir(user_id)
+    if data_dir is not None and os.path.realpath(entry.workspace) != os.path.dirname(data_dir):
+        dataset_cache.invalidate(user_id)
+        entry = dataset_cache.get(user_id)
+    return entry
+
+
+dataset_cache = DatasetCache(load_dataset)
+answer_cache = make_answer_cache()
+refresher = RefreshScheduler(refresh_dataset)
+
+_llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+_sandbox_semaphore = asyncio.Semaphore(SANDBOX_CONCURRENCY)
+
+
+def get_client() -> AsyncOpenAI:
+    global client
+    if client is None:
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return client
+
+
+class ChatSession:
+    """State of a single /chat request; nothing here is shared between requests."""
+
+    def __init__(self, user_id: str, dataset: DatasetEntry, conversation_history: List[dict]):
+        self.user_id = user_id
+        self.dataset = dataset
+        # Old turns are folded into a summary once the history exceeds its budget
+        self.messages = [{"role": "system", "content": dataset.instructions}] + compact_messages(
+            conversation_history
+        )
+        # OpenAI usage of every completion made for this request
+        self.iterations = []
+        self.tool_semaphore = asyncio.Semaphore(TOOL_CALL_CONCURRENCY)
+        # Set once a tool read the clock or drew random numbers: the answer
+        # then depends on more than the data and is not replayed
+        self.volatile = False
+
+    def record_usage(self, usage):
+        iteration_usage = usage_to_dict(usage)
+        iteration_usage["cost_usd"] = record_llm_usage(iteration_usage)
+        self.iterations.append(iteration_usage)
+
+    def usage_summary(self) -> dict:
+        totals = {
+            key: sum(iteration[key] for iteration in self.iterations)
+            for key in ("prompt_tokens", "cached_prompt_tokens", "completion_tokens", "cost_usd")
+        }
+        return {**totals, "iterations": self.iterations}
+
+
+def is_volatile_tool(tool) -> bool:
+    """Whether the result of `tool` may change on identical data."""
+    if isinstance(tool, InventoryCodeInterpreter):
+        return is_volatile_code(tool.python_code)
+    if isinstance(tool, SQLAnalysis):
+        return is_volatile_sql(tool.sql)
+    return False
+
+
+async def run_tool(session: ChatSession, tc_name: str, tc_args: str) -> str:
+    async with session.tool_semaphore:
+        return await _run_tool(session, tc_name, tc_args)
+
+
+async def _run_tool(session: ChatSession, tc_name: str, tc_args: str) -> str:
+    tool, error = parse_tool_call(tc_name, tc_args)
+    if error is not None:
+        return error
+    if is_volatile_tool(tool):
+        session.volatile = True
+    if isinstance(tool, QueryAnalysisOutput):
+        # Structured queries run in-process on the cached frames
+        with STAGE_SECONDS.time(stage="query"):
+            return await asyncio.to_thread(tool.run, session.dataset.tables)
+    if isinstance(tool, SQLAnalysis):
+        # SQL runs in-process on the snapshot files, reading only what it needs
+        with STAGE_SECONDS.time(stage="sql"):
+            data_dir = os.path.join(session.dataset.workspace, TABLES_DIR)
+            return await asyncio.to_thread(tool.run, data_dir)
+    async with _sandbox_semaphore:
+        return await asyncio.to_thread(tool.run, cwd=session.dataset.workspace)
+
+
+async def stream_completion(messages: List[dict], tokens: asyncio.Queue):
+    """
+    Stream one completion, putting each piece of assistant text on `tokens`
+    and None once the stream ends. Return the text pieces, the tool calls
+    keyed by their index and the usage of the completion.
+    """
+    content_parts = []
+    tool_calls = {}
+    usage = None
+    try:
+        async with _llm_semaphore:
+            llm_started = time.perf_counter()
+            stream = await get_client().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                tools=TOOLS,
+                stream=True,
+                stream_options={"include_usage": True},
+                temperature=0,
+            )
+            async for chunk in stream:
+                # The last chunk carries the usage of the whole completion
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    tokens.put_nowait(delta.content)
+                # Tool calls arrive in fragments keyed by their index
+                for tc in delta.tool_calls or []:
+                    call = tool_calls.setdefault(
+                        tc.index,
+                        {"id": None, "type": "function", "function": {"name": "", "arguments": ""}},
+                    )
+                    if tc.id:
+                        call["id"] = tc.id
+                    if tc.function and tc.function.name:
+                        call["function"]["name"] += tc.function.name
+                    if tc.function and tc.function.arguments:
+                        call["function"]["arguments"] += tc.function.arguments
+            STAGE_SECONDS.observe(time.perf_counter() - llm_started, stage="llm")
+    finally:
+        tokens.put_nowait(None)
+    return content_parts, tool_calls, usage
+
+
+async def chat_events(conversation_history: List[dict], user_id: str):
+    """
+    Run the tool loop for one conversation and yield ``(event, data)`` pairs as
+    they happen: "token" for every streamed piece of assistant text,
+    "tool_call_start"/"tool_call_end" around each tool run (the tool calls of
+    one turn run concurrently) and a final "done" carrying the complete
+    response and the token usage of every iteration.
+    Answers already given for the same conversation over the same data are
+    replayed from the answer cache without calling the model.
+    """
+    dataset = await asyncio.to_thread(current_dataset, user_id)
+    # Keeps the user's tables refreshed while it is active
+    refresher.touch(user_id)
+    session = ChatSession(user_id, dataset, conversation_history)
+
+    cache_key = answer_cache.key(user_id, conversation_history, dataset.version, OPENAI_MODEL)
+    cached = await asyncio.to_thread(answer_cache.get, cache_key)
+    if cached is not None:
+        yield "done", {**cached, "usage": session.usage_summary(), "cached": True}
+        return
+
+    iteration = 0
+    content = ""
+
+    while iteration < MAX_FUNCTION_CALL_ITERATIONS:
+        # Call the OpenAI API with the current conversation messages. The
+        # stream is read by its own task, so a slow client does not hold an
+        # LLM slot: tokens are queued and relayed from here.
+        tokens = asyncio.Queue()
+        completion = asyncio.create_task(stream_completion(session.messages, tokens))
+        try:
+            while (token := await tokens.get()) is not None:
+                yield "token", {"content": token}
+            content_parts, tool_calls, usage = await completion
+        finally:
+            completion.cancel()
+        session.record_usage(usage)
+
+        content = "".join(content_parts)
+        assistant_message = {"role": "assistant", "content": content or None}
+        if tool_calls:
+            assistant_message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+        session.messages.append(assistant_message)
+
+        # Process tool calls if any
+        if tool_calls:
+            calls = assistant_message["tool_calls"]
+            for tool_call in calls:
+                yield "tool_call_start", {
+                    "id": tool_call["id"],
+                    "name": tool_call["function"]["name"],
+                    "arguments": tool_call["function"]["arguments"],
+                }
+
+            # Run every tool the model picked concurrently, reporting each as it finishes
+            async def run_call(index: int):
+                function = calls[index]["function"]
+                return index, await run_tool(session, function["name"], function["arguments"])
+
+            results = [None] * len(calls)
+            for finished in asyncio.as_completed([run_call(i) for i in range(len(calls))]):
+                index, tool_result = await finished
+                results[index] = tool_result
+                tool_call = calls[index]
+                yield "tool_call_end", {
+                    "id": tool_call["id"],
+                    "name": tool_call["function"]["name"],
+                    "result": tool_result,
+                }
+
+            # Append the tool results in call order, each capped to the tool budget
+            for tool_call, tool_result in zip(calls, results):
+                session.messages.append(
+                    {
+                        "role": "tool",
+                        "content": tool_result_content(
+                            tool_arguments(tool_call["function"]["arguments"]), tool_result
+                        ),
+                        "tool_call_id": tool_call["id"],
+                    }
+                )
+        else:
+            # Only complete answers over the data alone are worth replaying
+            if not session.volatile:
+                await asyncio.to_thread(
+                    answer_cache.put, cache_key, user_id, {"response": content}
+                )
+            break
+
+        iteration += 1
+
+    yield "done", {"response": content, "usage": session.usage_summary(), "cached": False}
+
+
+async def chatbot_response(conversation_history: List[dict], user_id: str):
+    """
+    Process a conversation history and return the chatbot's final response
+    together with its token usage and whether it came from the answer cache.
+    
+    The conversation_history should be a list of messages, where each message is a dict:
+        {"role": "user" or "assistant", "content": "Your message text"}
+    """
+    result = {"response": "", "usage": None, "cached": False}
+    async for event, data in chat_events(conversation_history, user_id):
+        if event == "done":
+            result = data
+    return result
+
+
+def workspace_memory(user_id: str) -> dict:
+    data_dir = current_data_dir(user_id)
+    return memory_report(data_dir) if data_dir else {}
+
+
+def warm_up():
+    """Start the refresh scheduler and the sandbox workers, and wait until one of them runs code."""
+    refresher.start()
+    get_pool().run("pass")
@@ -0,0 +1,113 @@
+"""
+Keep the conversation sent to the model within a token budget.
+
+Tool outputs are capped when they are produced, keeping their head and tail.
+When the history goes over CONTEXT_TOKEN_BUDGET, the last KEEP_LAST_EXCHANGES
+exchanges (a user message and everything answering it) are kept verbatim, or
+fewer if they alone exceed the budget, and the older ones are folded into a
+short summary of questions and answers.
+"""
+
+import json
+import os
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "12000"))
+TOOL_RESULT_MAX_TOKENS = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "1500"))
+KEEP_LAST_EXCHANGES = int(os.getenv("KEEP_LAST_EXCHANGES", "3"))
+# Length of a question or answer in the summary of folded exchanges
+SUMMARY_ITEM_MAX_CHARS = 300
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def message_tokens(message: dict) -> int:
+    tokens = estimate_tokens(message.get("content"))
+    for tool_call in message.get("tool_calls") or []:
+        tokens += estimate_tokens(tool_call["function"]["arguments"])
+    return tokens
+
+
+def truncate_tool_output(text: str, max_tokens: int = TOOL_RESULT_MAX_TOKENS) -> str:
+    """Keep the head and the tail of an oversized tool output."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    head, tail = text[: max_chars * 2 // 3], text[-(max_chars // 3):]
+    omitted = len(text) - len(head) - len(tail)
+    return (
+        f"{head}\n... [{omitted} characters omitted; print a smaller or aggregated "
+        f"result to see them] ...\n{tail}"
+    )
+
+
+def _clip(text: str, max_chars: int = SUMMARY_ITEM_MAX_CHARS) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= max_chars else text[: max_chars - 3] + "..."
+
+
+def _split_exchanges(messages: list) -> list:
+    exchanges = []
+    for message in messages:
+        if message["role"] == "user" or not exchanges:
+            exchanges.append([])
+        exchanges[-1].append(message)
+    return exchanges
+
+
+def _summarize_exchange(exchange: list) -> str:
+    questions = [m["content"] for m in exchange if m["role"] == "user"]
+    answers = [m["content"] for m in exchange if m["role"] == "assistant" and m.get("content")]
+    n_tools = sum(1 for m in exchange if m["role"] == "tool")
+    line = f"- User: {_clip(questions[0] if questions else '')}"
+    if answers:
+        line += f"\n  Assistant: {_clip(answers[-1])}"
+    if n_tools:
+        line += f" ({n_tools} tool call{'s' if n_tools > 1 else ''})"
+    return line
+
+
+def compact_messages(
+    messages: list,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    keep_last: int = KEEP_LAST_EXCHANGES,
+) -> list:
+    """
+    Return the messages to send for `messages` (the history without the
+    system prompt). The history is returned unchanged while it fits in
+    `budget` so the cached prompt prefix stays stable.
+    """
+    if sum(map(message_tokens, messages)) <= budget:
+        return list(messages)
+    exchanges = _split_exchanges(messages)
+    exchange_tokens = [sum(map(message_tokens, exchange)) for exchange in exchanges]
+    # The exchange in progress is always kept, even when it alone is over budget
+    n_old = max(0, len(exchanges) - max(1, keep_last))
+    while n_old < len(exchanges) - 1 and sum(exchange_tokens[n_old:]) > budget:
+        n_old += 1
+    recent = [message for exchange in exchanges[n_old:] for message in exchange]
+
+    # Keep the summaries of the most recent folded exchanges that still fit
+    remaining = budget - sum(exchange_tokens[n_old:])
+    summaries = []
+    for exchange in reversed(exchanges[:n_old]):
+        summary = _summarize_exchange(exchange)
+        if estimate_tokens(summary) > remaining:
+            break
+        summaries.append(summary)
+        remaining -= estimate_tokens(summary)
+    if not summaries:
+        return recent
+    summary_message = {
+        "role": "system",
+        "content": "Summary of the earlier part of the conversation:\n"
+        + "\n".join(reversed(summaries)),
+    }
+    return [summary_message] + recent
+
+
+def tool_result_content(arguments: dict, result: str) -> str:
+    """The content of a tool message, with the output capped to the budget."""
+    return json.dumps({**arguments, "result": truncate_tool_output(result)})
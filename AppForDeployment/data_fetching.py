@@ -1,23 +1,89 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from token_cache import TOKEN_CACHE
+from result_cache import RESULT_CACHE
+from metrics import STAGE_SECONDS
+from schema import compact_schema
+from dtype_optimizer import align_dtypes, optimize_with_report
+from flattening import normalize_records, parent_key_prefix
+from views import VIEWS, build_view, view_sources
+from rollups import ROLLUPS, build_rollup, rollup_sources
+from snapshots import create_snapshot, current_snapshot, prune_snapshots, publish_snapshot
 
+GATEWAY_URL = os.getenv("GATEWAY_URL", "https://gateway-dev.supplyz.tech").rstrip("/")
 TABLE_URLS = {
-    "clients": "https://gateway-dev.supplyz.tech/orders_service/ai/v1/clients",
-    "invoices": "https://gateway-dev.supplyz.tech/orders_service/ai/v1/invoices",
-    "items": "https://gateway-dev.supplyz.tech/inventory/ai/v1/items",
-    "purchases": "https://gateway-dev.supplyz.tech/inventory/ai/v1/purchases",
-    "suppliers": "https://gateway-dev.supplyz.tech/inventory/ai/v1/suppliers",
+    "clients": f"{GATEWAY_URL}/orders_service/ai/v1/clients",
+    "invoices": f"{GATEWAY_URL}/orders_service/ai/v1/invoices",
+    "items": f"{GATEWAY_URL}/inventory/ai/v1/items",
+    "purchases": f"{GATEWAY_URL}/inventory/ai/v1/purchases",
+    "suppliers": f"{GATEWAY_URL}/inventory/ai/v1/suppliers",
 }
+TABLE_NAMES = ("items", "clients", "purchases", "invoices", "suppliers")
+DATA_ROOT = os.getenv("DATA_ROOT", "workspaces")
+_USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "5"))
 
+# Incremental sync: records carrying one of UPDATED_AT_FIELDS are re-requested
+# with DELTA_QUERY_PARAM set to the newest value seen, and upserted by key.
+INCREMENTAL_SYNC = os.getenv("INCREMENTAL_SYNC", "1") == "1"
+UPDATED_AT_FIELDS = ("updated_at", "updatedAt")
+DELTA_QUERY_PARAM = "updated_since"
+PRIMARY_KEYS = {table_name: "_id" for table_name in TABLE_NAMES}
+SYNC_STATE_FILE = "_sync_state.json"
+# Base and child table names of the last sync, in prompt order.
+TABLES_MANIFEST = "_tables.json"
+# Fingerprints of the source tables each view or rollup was built from.
+VIEWS_STATE_FILE = "_views.json"
+ROLLUPS_STATE_FILE = "_rollups.json"
+# Memory use of each table before and after dtype optimization.
+MEMORY_REPORT_FILE = "_memory_report.json"
+# Each sync writes <workspace>/snapshots/<id>/data; <workspace>/current points
+# to the last complete one.
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_LINK = "current"
 
-def get_user_token(user_id: str) -> str:
-    url = f"https://gateway-dev.supplyz.tech/user_management_service/ai/v1/auth?user_id={user_id}&duration=72h"
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """Return the shared keep-alive session for the gateway host of `url`."""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=FETCH_CONCURRENCY)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def _request_user_token(user_id: str) -> str:
+    url = f"{GATEWAY_URL}/user_management_service/ai/v1/auth?user_id={user_id}&duration=72h"
     headers = {"ai-key": "randomAIKey"}
-    resp = requests.get(url, headers=headers)
+    resp = get_session(url).get(url, headers=headers)
     resp.raise_for_status()
     return resp.json()["token"]
 
 
+def get_user_token(user_id: str) -> str:
+    return TOKEN_CACHE.get(user_id, _request_user_token)
+
+
 def flatten_json(y, sep="_"):
     """
     Recursively flattens a nested JSON/dictionary.
@@ -47,66 +113,454 @@ def flatten_json(y, sep="_"):
     return out
 
 
-def fetch_data(table_name: str, user_id: str) -> pd.DataFrame:
-    token = get_user_token(user_id)
+def _gateway_get(
+    url: str, user_id: str, token: str, headers: dict = None, params: dict = None
+) -> requests.Response:
+    headers = {"ai-key": "randomAIKey", "user-token": token, **(headers or {})}
+    with STAGE_SECONDS.time(stage="gateway_fetch"):
+        resp = get_session(url).get(url, headers=headers, params=params)
+        if resp.status_code == 401:
+            # The gateway rejected the token: drop it and retry once with a fresh one.
+            TOKEN_CACHE.invalidate(user_id, token)
+            headers["user-token"] = get_user_token(user_id)
+            resp = get_session(url).get(url, headers=headers, params=params)
+    resp.raise_for_status()
+    return resp
+
+
+def _table_url(table_name: str) -> str:
     try:
-        url = TABLE_URLS[table_name]
+        return TABLE_URLS[table_name]
     except KeyError:
         raise ValueError(f"Unknown table: {table_name}")
-    headers = {"ai-key": "randomAIKey", "user-token": token}
-    resp = requests.get(url, headers=headers)
-    resp.raise_for_status()
-    json_data = resp.json()
 
-    flat_records = [flatten_json(record) for record in json_data["data"]]
-    df = pd.DataFrame(flat_records)
-    return df.dropna(axis=1, how="all")
 
+def _records_to_frames(table_name: str, records: list) -> dict:
+    with STAGE_SECONDS.time(stage="flatten"):
+        tables = normalize_records(table_name, records, PRIMARY_KEYS.get(table_name, "_id"))
+    return {name: df.dropna(axis=1, how="all") for name, df in tables.items()}
 
-def update_data(user_id: str):
-    fetch_data("items", user_id).to_parquet(
-        "data/items.parquet"
-    )
-    fetch_data("clients", user_id).to_parquet(
-        "data/clients.parquet"
-    )
-    fetch_data("purchases", user_id).to_parquet(
-        "data/purchases.parquet"
-    )
-    fetch_data("invoices", user_id).to_parquet(
-        "data/invoices.parquet"
-    )
-    fetch_data("suppliers", user_id).to_parquet(
-        "data/suppliers.parquet"
-    )
 
+def fetch_data(table_name: str, user_id: str, token: str = None) -> dict:
+    """
+    Fetch one table and return it together with the child tables built from
+    its nested record lists, as ``{table name: DataFrame}``.
+    """
+    token = token or get_user_token(user_id)
+    resp = _gateway_get(_table_url(table_name), user_id, token)
+    return _records_to_frames(table_name, resp.json()["data"])
 
 
+def fetch_table_changes(table_name: str, user_id: str, token: str, state: dict):
+    """
+    Fetch what changed in `table_name` since the sync described by `state`.
 
-def get_data():
-    items = pd.read_parquet("data/items.parquet")
-    clients = pd.read_parquet(
-        "data/clients.parquet"
-    )
-    purchases = pd.read_parquet(
-        "data/purchases.parquet"
-    )
-    invoices = pd.read_parquet(
-        "data/invoices.parquet"
-    )
-    suppliers = pd.read_parquet(
-        "data/suppliers.parquet"
+    Returns ``(frames, is_delta, new_state)`` where `frames` maps the table
+    and its child tables to DataFrames, as in `fetch_data`. `frames` is None
+    when the gateway reports the table as unchanged. `is_delta` is True when
+    `frames` only hold changed records that must be upserted into the stored
+    tables; it is False when they are a full copy.
+    """
+    headers, params = {}, {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+    if state.get("high_water_mark") is not None:
+        params[DELTA_QUERY_PARAM] = state["high_water_mark"]
+
+    resp = _gateway_get(_table_url(table_name), user_id, token, headers, params)
+    if resp.status_code == 304:
+        return None, False, state
+
+    frames = _records_to_frames(table_name, resp.json()["data"])
+    df = frames[table_name]
+    new_state = {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "high_water_mark": None,
+    }
+    updated_field = next((f for f in UPDATED_AT_FIELDS if f in df.columns), None)
+    if updated_field is None:
+        # No delta signal in the records: this is always a full refresh.
+        return frames, False, new_state
+
+    if len(df):
+        # Store a plain Python value so the mark round-trips through JSON.
+        hwm_value = df[updated_field].max()
+        new_state["high_water_mark"] = getattr(hwm_value, "item", lambda: hwm_value)()
+    hwm = state.get("high_water_mark")
+    if hwm is None:
+        return frames, False, new_state
+    if not len(df):
+        new_state["high_water_mark"] = hwm
+        return None, False, new_state
+    # Records older than the mark show that the gateway ignored the filter and
+    # sent the full table. Otherwise only changed records came back, plus,
+    # with an inclusive filter (>=), those stamped with the mark itself: they
+    # are upserted, never allowed to replace the stored table.
+    is_delta = not (df[updated_field].dropna() < hwm).any()
+    return frames, is_delta, new_state
+
+
+def upsert_records(
+    stored: pd.DataFrame, changes: pd.DataFrame, key: str, replaced_keys=None
+) -> pd.DataFrame:
+    """
+    Drop the rows of `stored` whose `key` is in `replaced_keys` (by default
+    the keys present in `changes`) and append `changes`.
+    """
+    if replaced_keys is None:
+        replaced_keys = changes[key]
+    kept = stored[~stored[key].isin(replaced_keys)]
+    if not len(changes):
+        return kept.reset_index(drop=True)
+    # The stored rows have optimized dtypes, the fetched ones JSON types
+    kept, changes = align_dtypes(kept, changes)
+    merged = pd.concat([kept, changes], ignore_index=True)
+    return merged.dropna(axis=1, how="all")
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Stringify object columns with mixed JSON values that Arrow cannot type."""
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].map(lambda v: v if v is None else str(v))
+    return df
+
+
+def write_arrow_snapshot(df: pd.DataFrame, path: str):
+    """
+    Write a table as an uncompressed Arrow IPC file that the sandbox can
+    memory-map. The file is swapped in atomically so workers that already
+    mapped the previous version keep a valid view.
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        table = pa.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def user_workspace(user_id: str) -> str:
+    """Per-user directory holding the snapshots of the user's tables."""
+    if not _USER_ID_PATTERN.match(user_id):
+        raise ValueError(f"Invalid user_id: {user_id!r}")
+    return os.path.abspath(os.path.join(DATA_ROOT, user_id))
+
+
+def current_data_dir(user_id: str):
+    """
+    The ./data directory of the user's published snapshot, or None before
+    the first sync. The snapshot directory is what the sandbox runs in, so
+    the paths given to the model stay the same.
+    """
+    snapshot = current_snapshot(os.path.join(user_workspace(user_id), CURRENT_LINK))
+    return os.path.join(snapshot, "data") if snapshot else None
+
+
+def _load_sync_state(data_dir: str, state_file: str = SYNC_STATE_FILE) -> dict:
+    try:
+        with open(os.path.join(data_dir, state_file)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_sync_state(data_dir: str, state: dict, state_file: str = SYNC_STATE_FILE):
+    path = os.path.join(data_dir, state_file)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f, default=str)
+    os.replace(f"{path}.tmp", path)
+
+
+def _read_stored(data_dir: str, table_name: str) -> pd.DataFrame:
+    path = os.path.join(data_dir, f"{table_name}.parquet")
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    with STAGE_SECONDS.time(stage="table_io"):
+        return pd.read_parquet(path)
+
+
+def write_table(df: pd.DataFrame, data_dir: str, table_name: str):
+    """
+    Write the parquet and Arrow files of a table. Both are swapped in with a
+    rename, never rewritten in place: the files of a new snapshot start as
+    hard links to those of the previous one.
+    """
+    path = os.path.join(data_dir, f"{table_name}.parquet")
+    with STAGE_SECONDS.time(stage="table_io"):
+        df.to_parquet(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        write_arrow_snapshot(df, os.path.join(data_dir, f"{table_name}.arrow"))
+
+
+def sync_table(
+    table_name: str, user_id: str, token: str, data_dir: str, state: dict
+) -> dict:
+    """
+    Bring the stored copy of one table and its child tables up to date and
+    return the table's new sync state.
+    """
+    if not os.path.exists(os.path.join(data_dir, f"{table_name}.parquet")):
+        state = {}
+    frames, is_delta, new_state = fetch_table_changes(table_name, user_id, token, state)
+    if frames is None:
+        return new_state
+    if is_delta:
+        key = PRIMARY_KEYS.get(table_name, "_id")
+        changed_keys = frames[table_name][key]
+        parent_key = f"{parent_key_prefix(table_name)}_id"
+        frames[table_name] = upsert_records(
+            _read_stored(data_dir, table_name), frames[table_name], key
+        )
+        for name in set(state.get("children", [])) | set(frames) - {table_name}:
+            stored = _read_stored(data_dir, name)
+            if parent_key in stored.columns:
+                # The lines of a changed record are replaced as a whole.
+                frames[name] = upsert_records(
+                    stored, frames.get(name, pd.DataFrame()), parent_key, changed_keys
+                )
+    memory = {}
+    for name, df in frames.items():
+        df, memory[name] = optimize_with_report(df)
+        write_table(df, data_dir, name)
+    new_state["children"] = sorted(name for name in frames if name != table_name)
+    # Moved to the memory report by update_data
+    new_state["memory"] = memory
+    return new_state
+
+
+def _table_fingerprint(data_dir: str, table_name: str):
+    try:
+        stat = os.stat(os.path.join(data_dir, f"{table_name}.parquet"))
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _refresh_derived(data_dir: str, names, sources_of, build, state_file: str) -> list:
+    """
+    Rebuild the derived tables (views, rollups) whose source tables changed
+    since they were last built and return the names of those that exist.
+    """
+    state = _load_sync_state(data_dir, state_file)
+    new_state = {}
+    tables = {}
+    for derived_name in names:
+        sources = {name: _table_fingerprint(data_dir, name) for name in sources_of(derived_name)}
+        derived_path = os.path.join(data_dir, f"{derived_name}.parquet")
+        if state.get(derived_name) == sources and os.path.exists(derived_path):
+            new_state[derived_name] = sources
+            continue
+        for name in sources:
+            if name not in tables and sources[name] is not None:
+                tables[name] = _read_stored(data_dir, name)
+        df = build(derived_name, tables)
+        if df is None:
+            for ext in ("parquet", "arrow"):
+                path = os.path.join(data_dir, f"{derived_name}.{ext}")
+                if os.path.exists(path):
+                    os.remove(path)
+            continue
+        write_table(df, data_dir, derived_name)
+        new_state[derived_name] = sources
+    _save_sync_state(data_dir, new_state, state_file)
+    return list(new_state)
+
+
+def refresh_views(data_dir: str) -> list:
+    return _refresh_derived(data_dir, VIEWS, view_sources, build_view, VIEWS_STATE_FILE)
+
+
+def refresh_rollups(data_dir: str) -> list:
+    """Must run after refresh_views: rollups may aggregate views."""
+    return _refresh_derived(data_dir, ROLLUPS, rollup_sources, build_rollup, ROLLUPS_STATE_FILE)
+
+
+def _sync_snapshot(user_id: str, data_dir: str, incremental: bool, concurrency: int):
+    """Sync every table of `user_id` into the snapshot `data_dir`."""
+    state = _load_sync_state(data_dir) if incremental else {}
+    token = get_user_token(user_id)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            table_name: executor.submit(
+                sync_table, table_name, user_id, token, data_dir, state.get(table_name, {})
+            )
+            for table_name in TABLE_NAMES
+        }
+        new_state = {name: future.result() for name, future in futures.items()}
+
+    tables = list(TABLE_NAMES)
+    memory = _load_sync_state(data_dir, MEMORY_REPORT_FILE)
+    for table_state in new_state.values():
+        tables.extend(table_state["children"])
+        memory.update(table_state.pop("memory", {}))
+    _save_sync_state(
+        data_dir, {name: memory[name] for name in tables if name in memory}, MEMORY_REPORT_FILE
     )
-    items_sig = items.dtypes.to_dict()
-    clients_sig = clients.dtypes.to_dict()
-    purchases_sig = purchases.dtypes.to_dict()
-    invoices_sig = invoices.dtypes.to_dict()
-    suppliers_sig = suppliers.dtypes.to_dict()
+    # Views and rollups come after the tables they are built from
+    tables.extend(refresh_views(data_dir))
+    tables.extend(refresh_rollups(data_dir))
+    for stale in set(_load_manifest(data_dir)) - set(tables):
+        for ext in ("parquet", "arrow"):
+            path = os.path.join(data_dir, f"{stale}.{ext}")
+            if os.path.exists(path):
+                os.remove(path)
+    _save_manifest(data_dir, tables)
+    _save_sync_state(data_dir, new_state)
+
+
+def update_data(
+    user_id: str,
+    incremental: bool = INCREMENTAL_SYNC,
+    concurrency: int = FETCH_CONCURRENCY,
+) -> str:
+    """
+    Sync every table of `user_id` into a new snapshot of its workspace and
+    publish it; return the data directory of the published snapshot. Tables
+    are fetched concurrently with a single user token; with `incremental`,
+    only records changed since the previous sync are downloaded where the
+    gateway allows it. Readers of the previous snapshot are never affected,
+    and a sync that fails or changes nothing publishes nothing.
+    """
+    workspace = user_workspace(user_id)
+    snapshots_dir = os.path.join(workspace, SNAPSHOTS_DIR)
+    previous_dir = current_data_dir(user_id)
+    # Workspaces synced before snapshots existed kept their tables in ./data
+    legacy_dir = os.path.join(workspace, "data")
+    seed_dir = previous_dir or (legacy_dir if os.path.isdir(legacy_dir) else None)
+    data_dir = create_snapshot(snapshots_dir, seed_dir if incremental else None)
+    snapshot = os.path.dirname(data_dir)
+    try:
+        _sync_snapshot(user_id, data_dir, incremental, concurrency)
+    except BaseException:
+        shutil.rmtree(snapshot, ignore_errors=True)
+        raise
+
+    if previous_dir and data_version(data_dir) == data_version(previous_dir):
+        # Nothing changed: keep serving the current snapshot and its cached results
+        shutil.rmtree(snapshot, ignore_errors=True)
+        return previous_dir
+    publish_snapshot(os.path.join(workspace, CURRENT_LINK), snapshot, snapshots_dir)
+    prune_snapshots(snapshots_dir, in_use=[snapshot])
+    if previous_dir:
+        # Results computed against the previous snapshot are no longer valid
+        RESULT_CACHE.invalidate(os.path.dirname(previous_dir))
+    return data_dir
+
 
+def memory_report(data_dir: str) -> dict:
+    """Memory of each table before and after dtype optimization, with the bytes saved."""
     return {
-        "items": [items, items_sig],
-        "clients": [clients, clients_sig],
-        "purchases": [purchases, purchases_sig],
-        "invoices": [invoices, invoices_sig],
-        "suppliers": [suppliers, suppliers_sig],
+        name: {**usage, "saved_bytes": usage["before_bytes"] - usage["after_bytes"]}
+        for name, usage in _load_sync_state(data_dir, MEMORY_REPORT_FILE).items()
     }
+
+
+def _load_manifest(data_dir: str) -> list:
+    try:
+        with open(os.path.join(data_dir, TABLES_MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return list(TABLE_NAMES)
+
+
+def _save_manifest(data_dir: str, tables: list):
+    path = os.path.join(data_dir, TABLES_MANIFEST)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(tables, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_table(table_name: str, data_dir: str = "data") -> pd.DataFrame:
+    with STAGE_SECONDS.time(stage="table_io"):
+        return pd.read_parquet(os.path.join(data_dir, f"{table_name}.parquet"))
+
+
+def get_data(data_dir: str = "data"):
+    data = {}
+    for table_name in _load_manifest(data_dir):
+        df = read_table(table_name, data_dir)
+        data[table_name] = [df, compact_schema(df)]
+    return data
+
+
+def table_names(data_dir: str = "data") -> list:
+    """Names of the tables stored in `data_dir`, in prompt order."""
+    return _load_manifest(data_dir)
+
+
+def open_dataset(table_name: str, data_dir: str = "data") -> ds.Dataset:
+    """
+    The parquet file of a table as a pyarrow dataset: scans read only the
+    columns and row groups a query needs.
+    """
+    return ds.dataset(os.path.join(data_dir, f"{table_name}.parquet"), format="parquet")
+
+
+class LazyTables(Mapping):
+    """
+    Read-only ``{table name: DataFrame}`` view of the tables in `data_dir`.
+    Each table is read on first access and then kept in memory until
+    `data_dir` points to another snapshot.
+    """
+
+    def __init__(self, data_dir: str = "data"):
+        self.data_dir = data_dir
+        self._frames = {}
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def __getitem__(self, table_name: str) -> pd.DataFrame:
+        with self._lock:
+            snapshot = os.path.realpath(self.data_dir)
+            if snapshot != self._snapshot:
+                self._frames, self._snapshot = {}, snapshot
+            if table_name not in self._frames:
+                if table_name not in _load_manifest(self.data_dir):
+                    raise KeyError(table_name)
+                self._frames[table_name] = read_table(table_name, self.data_dir)
+            return self._frames[table_name]
+
+    def __iter__(self):
+        return iter(_load_manifest(self.data_dir))
+
+    def __len__(self) -> int:
+        return len(_load_manifest(self.data_dir))
+
+
+def data_version(data_dir: str = "data") -> str:
+    """
+    Fingerprint of the tables stored in `data_dir`. It changes whenever a
+    sync rewrites one of them and stays the same when nothing changed.
+    """
+    try:
+        entries = list(os.scandir(data_dir))
+    except FileNotFoundError:
+        return ""
+    stats = sorted(
+        (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+        for entry in entries
+        if entry.is_file()
+        and not entry.name.startswith("_")
+        and not entry.name.endswith(".tmp")
+    )
+    return hashlib.sha1(repr(stats).encode()).hexdigest()
+
+
+def format_child_tables(data: dict) -> str:
+    """Describe the child tables of `data` for the system prompt."""
+    children = [
+        name for name in data if name not in TABLE_NAMES and name not in VIEWS and name not in ROLLUPS
+    ]
+    if not children:
+        return "None"
+    return "\n\n".join(f"{name} :\n{data[name][1]}" for name in children)
@@ -0,0 +1,95 @@
+"""
+Per-user cache of the synced tables and the system prompt built from them.
+
+Entries are replaced when a refresh publishes a new snapshot (see
+refresh.py), and the least recently used users are evicted once the cached
+DataFrames exceed a total memory budget.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DATASET_CACHE_MAX_MB = float(os.getenv("DATASET_CACHE_MAX_MB", "512"))
+
+
+class DatasetEntry:
+    def __init__(self, data: dict, instructions: str, workspace: str, version: str = ""):
+        self.data = data
+        self.tables = {name: table[0] for name, table in data.items()}
+        self.signatures = {name: table[1] for name, table in data.items()}
+        self.instructions = instructions
+        self.workspace = workspace
+        # Fingerprint of the synced tables the entry was built from
+        self.version = version
+        self.nbytes = sum(
+            int(table[0].memory_usage(deep=True).sum()) for table in data.values()
+        )
+        self.loaded_at = time.monotonic()
+
+
+class DatasetCache:
+    """
+    `loader(user_id)` is called on a miss and must return a DatasetEntry.
+    Concurrent misses for the same user share a single load.
+    """
+
+    def __init__(self, loader, max_bytes: int = int(DATASET_CACHE_MAX_MB * 1024 * 1024)):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._user_locks = {}
+
+    def _cached(self, user_id: str):
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+        return entry
+
+    def get(self, user_id: str) -> DatasetEntry:
+        with self._lock:
+            entry = self._cached(user_id)
+            if entry is not None:
+                return entry
+            user_lock = self._user_locks.setdefault(user_id, threading.Lock())
+
+        with user_lock:
+            # Another request may have loaded it while we waited.
+            with self._lock:
+                entry = self._cached(user_id)
+            if entry is not None:
+                return entry
+            entry = self.loader(user_id)
+            with self._lock:
+                self._entries[user_id] = entry
+                self._evict()
+            return entry
+
+    def peek(self, user_id: str):
+        """The cached entry of `user_id`, if any, without loading it."""
+        with self._lock:
+            return self._entries.get(user_id)
+
+    def put(self, user_id: str, entry: DatasetEntry):
+        """Swap in the entry built from a newly published snapshot."""
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            self._evict()
+
+    def _evict(self):
+        total = sum(entry.nbytes for entry in self._entries.values())
+        # Never evict the most recent entry, even if it alone is over budget.
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            total -= evicted.nbytes
+
+    def invalidate(self, user_id: str = None):
+        """Drop one user's entry, or every entry when `user_id` is None."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
@@ -0,0 +1,106 @@
+"""
+Compact dtypes for the synced tables.
+
+JSON gives object columns for ids, enums and dates and float64 for any
+numeric column with a missing value. ``optimize_dtypes`` converts, column by
+column:
+- ISO date strings to datetime64 (naive, in UTC),
+- repetitive strings to categoricals,
+- integral floats to int64, or to nullable Int64 when values are missing.
+Numbers are never narrowed: quantities and prices are multiplied together in
+generated code and rollups, where int32 would silently overflow, and other
+floats are mostly amounts, which need float64 precision.
+The types survive in the parquet and Arrow files.
+"""
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# A string column becomes categorical when it has at most this ratio of
+# distinct values to non-missing values.
+CATEGORY_MAX_UNIQUE_RATIO = float(os.getenv("CATEGORY_MAX_UNIQUE_RATIO", "0.5"))
+DATE_SAMPLE_SIZE = 100
+# Primary keys are unique, looked up and upserted: keep them as plain strings
+KEEP_COLUMNS = ("_id",)
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+def _parse_dates(series: pd.Series):
+    """`series` as naive UTC datetime64, or None when some values are not ISO dates."""
+    dates = pd.to_datetime(series, errors="coerce", utc=True, format="ISO8601")
+    if dates.notna().sum() != series.notna().sum():
+        return None
+    return dates.dt.tz_localize(None)
+
+
+def _optimize_strings(series: pd.Series) -> pd.Series:
+    values = series.dropna()
+    if values.empty or not all(isinstance(value, str) for value in values):
+        return series
+    sample = values.iloc[:DATE_SAMPLE_SIZE]
+    if all(_ISO_DATE.match(value) for value in sample):
+        dates = _parse_dates(series)
+        if dates is not None:
+            return dates
+    if values.nunique() <= CATEGORY_MAX_UNIQUE_RATIO * len(values):
+        return series.astype("category")
+    return series
+
+
+def _optimize_column(series: pd.Series) -> pd.Series:
+    dtype = series.dtype
+    if dtype == object or pd.api.types.is_string_dtype(dtype):
+        return _optimize_strings(series)
+    if pd.api.types.is_float_dtype(dtype):
+        values = series.dropna()
+        if values.empty or not np.array_equal(values, np.round(values)):
+            return series
+        # Whole numbers that JSON or a missing value turned into floats
+        return series.astype("Int64" if series.isna().any() else "int64")
+    return series
+
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            column: df[column] if column in KEEP_COLUMNS else _optimize_column(df[column])
+            for column in df.columns
+        },
+        index=df.index,
+    )
+
+
+def align_dtypes(left: pd.DataFrame, right: pd.DataFrame):
+    """
+    Return `left` and `right` with the date columns they share in one dtype,
+    so that they can be concatenated: a stored table holds optimized dates
+    while freshly fetched records carry ISO strings. The strings are parsed
+    when they are all dates; otherwise the dates go back to ISO strings.
+    """
+    left, right = left.copy(), right.copy()
+    for column in left.columns.intersection(right.columns):
+        left_dates = pd.api.types.is_datetime64_any_dtype(left[column])
+        if left_dates == pd.api.types.is_datetime64_any_dtype(right[column]):
+            continue
+        dates, other = (left, right) if left_dates else (right, left)
+        parsed = _parse_dates(other[column]) if other[column].dtype == object else None
+        if parsed is not None:
+            other[column] = parsed
+        else:
+            dates[column] = dates[column].map(
+                lambda value: None if pd.isna(value) else value.isoformat()
+            )
+    return left, right
+
+
+def optimize_with_report(df: pd.DataFrame):
+    """Return the optimized frame and its memory use before and after, in bytes."""
+    optimized = optimize_dtypes(df)
+    return optimized, {
+        "before_bytes": int(df.memory_usage(deep=True).sum()),
+        "after_bytes": int(optimized.memory_usage(deep=True).sum()),
+    }
@@ -0,0 +1,237 @@
+"""
+Columnar flattening of the nested JSON records returned by the gateway.
+
+``flatten_records`` gives the same frame as flattening every record with
+``flatten_json`` and building a DataFrame from the list of dicts, but walks
+the records one nested path at a time: the schema of each level is inferred
+once and the column arrays are built with list comprehensions instead of a
+recursive Python call for every value of every record.
+"""
+
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+_SCALAR_TYPES = {str, int, float, bool, type(None)}
+
+
+class _NameCollision(Exception):
+    """Two different nested paths flatten to the same column name."""
+
+
+def _is_record_list(x) -> bool:
+    return isinstance(x, list) and bool(x) and all(isinstance(item, dict) for item in x)
+
+
+def _flat_names(x, sep: str, prefix: str = "", expand_lists: bool = True):
+    """Yield the flattened column names of one record in flatten_json order."""
+    if isinstance(x, dict):
+        for k, v in x.items():
+            yield from _flat_names(v, sep, f"{prefix}{k}{sep}", expand_lists)
+    elif _is_record_list(x):
+        if expand_lists:
+            for i, item in enumerate(x):
+                yield from _flat_names(item, sep, f"{prefix}{i}{sep}")
+    else:
+        yield prefix[:-1]
+
+
+def _flatten_level(
+    rows: list, values: list, prefix: str, sep: str, columns: dict, children: dict = None
+):
+    """
+    Flatten the `values` found at one nested path; `rows` holds the (sorted)
+    record index of each value. Leaves are stored in `columns` as
+    ``name -> (rows, values)``. When `children` is given, lists of records are
+    stored there the same way instead of being expanded into indexed columns.
+    """
+    kinds = set(map(type, values))
+    if kinds <= _SCALAR_TYPES:
+        # Fast paths: a plain leaf column, or a level made only of dicts.
+        leaf_rows, leaf_values = rows, values
+        dict_rows, dict_values, list_rows, list_values = [], [], [], []
+    elif kinds == {dict}:
+        dict_rows, dict_values = rows, values
+        leaf_rows, leaf_values, list_rows, list_values = [], [], [], []
+    else:
+        leaf_rows, leaf_values = [], []
+        dict_rows, dict_values = [], []
+        list_rows, list_values = [], []
+        for row, value in zip(rows, values):
+            if isinstance(value, dict):
+                dict_rows.append(row)
+                dict_values.append(value)
+            elif _is_record_list(value):
+                list_rows.append(row)
+                list_values.append(value)
+            else:
+                leaf_rows.append(row)
+                leaf_values.append(value)
+
+    if leaf_rows:
+        name = prefix[:-1]
+        if name in columns:
+            raise _NameCollision(name)
+        columns[name] = (leaf_rows, leaf_values)
+
+    for k in dict.fromkeys(chain.from_iterable(dict_values)):
+        try:
+            # Fast path: every record at this level has the key.
+            child_rows, child_values = dict_rows, list(map(itemgetter(k), dict_values))
+        except KeyError:
+            child_rows = [r for r, d in zip(dict_rows, dict_values) if k in d]
+            child_values = [d[k] for d in dict_values if k in d]
+        _flatten_level(
+            child_rows, child_values, f"{prefix}{k}{sep}", sep, columns, children
+        )
+
+    if children is not None:
+        if list_rows:
+            children[prefix[:-1]] = (list_rows, list_values)
+        return
+
+    i = 0
+    while list_rows:
+        child_values = [lst[i] for lst in list_values]
+        _flatten_level(list_rows, child_values, f"{prefix}{i}{sep}", sep, columns)
+        i += 1
+        # Only the lists that are long enough continue to the next index.
+        keep = [len(lst) > i for lst in list_values]
+        list_rows = [r for r, k in zip(list_rows, keep) if k]
+        list_values = [lst for lst, k in zip(list_values, keep) if k]
+
+
+def _flatten_row_major(records: list, sep: str, children: dict = None) -> pd.DataFrame:
+    """
+    Flatten record by record, as ``flatten_json`` does: on a name clash the
+    path met last in a record wins. With `children`, lists of records are
+    collected there instead of being expanded.
+    """
+    flat_records = []
+    for row, record in enumerate(records):
+        out = {}
+
+        def flatten(x, name=""):
+            if isinstance(x, dict):
+                for k, v in x.items():
+                    flatten(v, f"{name}{k}{sep}")
+            elif _is_record_list(x):
+                if children is not None:
+                    rows, lists = children.setdefault(name[:-1], ([], []))
+                    rows.append(row)
+                    lists.append(x)
+                    return
+                for i, item in enumerate(x):
+                    flatten(item, f"{name}{i}{sep}")
+            else:
+                out[name[:-1]] = x
+
+        flatten(record)
+        flat_records.append(out)
+    return pd.DataFrame(flat_records)
+
+
+def flatten_records(records: list, sep: str = "_", children: dict = None) -> pd.DataFrame:
+    """
+    Flatten a list of nested JSON records into one DataFrame.
+    - For dictionaries, it concatenates keys using the given separator.
+    - For lists, if all elements are dicts, it flattens each and adds an index.
+      Otherwise, it keeps the list as is.
+    Missing values are NaN, exactly as with ``pd.DataFrame(list_of_dicts)``.
+
+    If a `children` dict is passed, lists of dicts are left out of the frame
+    and collected in it as ``path -> (record indexes, lists)`` instead.
+    """
+    n_rows = len(records)
+    if not n_rows:
+        return pd.DataFrame(records)
+    columns = {}
+    try:
+        _flatten_level(list(range(n_rows)), records, "", sep, columns, children)
+    except _NameCollision:
+        # Which path wins a clash depends on per-record key order.
+        if children is not None:
+            children.clear()
+        return _flatten_row_major(records, sep, children)
+    if not columns:
+        return pd.DataFrame([{}] * n_rows)
+
+    # Columns are ordered by first appearance, scanning records in order.
+    ordered = {}
+    expand_lists = children is None
+    for first_row in sorted({rows[0] for rows, _ in columns.values()}):
+        for name in _flat_names(records[first_row], sep, expand_lists=expand_lists):
+            ordered.setdefault(name, None)
+
+    arrays = {}
+    for name in ordered:
+        rows, values = columns[name]
+        if len(rows) == n_rows:
+            arrays[name] = values
+        else:
+            array = [np.nan] * n_rows
+            for row, value in zip(rows, values):
+                array[row] = value
+            arrays[name] = array
+    return pd.DataFrame(arrays, index=pd.RangeIndex(n_rows))
+
+
+def child_table_name(table_name: str, path: str, sep: str = "_") -> str:
+    """`invoices` + `lines` -> `invoice_lines`."""
+    return f"{parent_key_prefix(table_name)}{sep}{path}"
+
+
+def parent_key_prefix(table_name: str) -> str:
+    return table_name[:-1] if table_name.endswith("s") else table_name
+
+
+def normalize_records(
+    table_name: str, records: list, key: str = "_id", sep: str = "_"
+) -> dict:
+    """
+    Flatten `records` into the table itself plus one long-format child table
+    per nested list of records, e.g. the `lines` of `invoices` become an
+    `invoice_lines` table with one row per line, linked to its invoice by an
+    `invoice_id` column and ordered by `position`. Lists nested inside the
+    child records keep the index-suffixed columns of `flatten_records`.
+    """
+    children = {}
+    parent = flatten_records(records, sep, children)
+    tables = {table_name: parent}
+    if key in parent.columns:
+        parent_ids = parent[key].to_numpy()
+    else:
+        parent_ids = np.arange(len(records))
+    parent_key = f"{parent_key_prefix(table_name)}{sep}id"
+
+    for path, (rows, lists) in children.items():
+        # Rows where the path holds an empty list only said "no children".
+        if path in parent.columns and parent[path].map(_is_empty_list).all():
+            parent = tables[table_name] = parent.drop(columns=path)
+        lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+        child = flatten_records(list(chain.from_iterable(lists)), sep)
+        _insert_column(child, 0, parent_key, np.repeat(parent_ids[rows], lengths), sep)
+        positions = np.concatenate([np.arange(n) for n in lengths])
+        _insert_column(child, 1, "position", positions, sep)
+        tables[child_table_name(table_name, path, sep)] = child
+    return tables
+
+
+def _insert_column(df: pd.DataFrame, loc: int, name: str, values: np.ndarray, sep: str):
+    """
+    Insert a link column. A field of the child records with the same name,
+    e.g. an `invoice_id` back-reference, is dropped when it holds the same
+    values and kept as `<name>_record` otherwise.
+    """
+    if name in df.columns:
+        existing = df.pop(name)
+        if not existing.astype(object).equals(pd.Series(values, index=df.index).astype(object)):
+            df[f"{name}{sep}record"] = existing
+    df.insert(loc, name, values)
+
+
+def _is_empty_list(x) -> bool:
+    # NaN marks rows where the path holds a list of records or nothing at all.
+    return isinstance(x, list) and not x or isinstance(x, float) and np.isnan(x)
@@ -1,45 +1,226 @@
-import subprocess
-import sys
-from data_fetching import get_data
+import ast
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Literal, Optional
+import duckdb
+from data_fetching import LazyTables, data_version, open_dataset, table_names
 import pandas as pd
 from pydantic import BaseModel, Field
+from sandbox import TABLES_DIR, get_pool
+from result_cache import RESULT_CACHE
 
 
-data = get_data()
-invoices, items, purchases, suppliers, clients = (
-    data["invoices"][0],
-    data["items"][0],
-    data["purchases"][0],
-    data["suppliers"][0],
-    data["clients"][0],
+# Base, child and derived tables, each read from ./data on first use
+DATA = LazyTables()
+
+
+QUERY_MAX_ROWS = 50
+AGGREGATIONS = Literal[
+    "sum", "mean", "median", "min", "max", "count", "nunique", "std", "first", "last"
+]
+# Resources of one SQLAnalysis query
+SQL_TIMEOUT_SECONDS = float(os.getenv("SQL_TIMEOUT_SECONDS", "30"))
+SQL_MEMORY_LIMIT = os.getenv("SQL_MEMORY_LIMIT", "1GB")
+SQL_THREADS = int(os.getenv("SQL_THREADS", "2"))
+
+
+# What a filtering_condition may call or read on a column: the query runs in
+# the API process, so nothing that writes files or builds huge values
+CONDITION_METHODS = frozenset(
+    ("isin", "between", "isna", "notna", "isnull", "notnull", "abs", "round", "str", "dt")
+)
+CONDITION_STR_METHODS = frozenset(
+    ("contains", "startswith", "endswith", "match", "fullmatch", "lower", "upper", "casefold")
+    + ("strip", "lstrip", "rstrip", "len", "isdigit", "isalpha", "isnumeric")
+)
+CONDITION_DT_FIELDS = frozenset(
+    ("year", "quarter", "month", "week", "day", "hour", "minute", "second")
+    + ("dayofweek", "weekday", "dayofyear", "date", "is_month_start", "is_month_end")
 )
+_MAX_EXPONENT = 100
 
-DATA = {
-    "invoices": invoices,
-    "items": items,
-    "purchases": purchases,
-    "suppliers": suppliers,
-    "clients": clients,
-}
+
+def _check_condition(condition: str, df: pd.DataFrame) -> None:
+    """
+    Allow a DataFrame.query() condition to use only the columns of `df`,
+    literals, operators and the column methods listed above (e.g.
+    ``name.str.contains('a')``): no other names or attributes, no local
+    variables (``@x``) and no repetition of strings or huge powers.
+    """
+    columns = {str(column): column for column in df.columns}
+    columns["index"] = None
+
+    def column_of(name: str):
+        if name not in columns:
+            raise ValueError(
+                f"filtering_condition may only refer to columns and literals, not {name!r}"
+            )
+        return columns[name]
+
+    def unquote(match):
+        placeholder = f"_quoted_column_{len(columns)}"
+        columns[placeholder] = column_of(match.group(1))
+        return placeholder
+
+    def is_text(node) -> bool:
+        """Whether `node` involves a string literal or a non-numeric column."""
+        for child in ast.walk(node):
+            if isinstance(child, ast.Constant) and isinstance(child.value, (str, bytes)):
+                return True
+            if isinstance(child, ast.Name) and columns.get(child.id) is not None:
+                if not pd.api.types.is_numeric_dtype(df[columns[child.id]]):
+                    return True
+        return False
+
+    # Backtick-quoted column names are not Python syntax
+    expression = re.sub(r"`([^`]*)`", unquote, condition)
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid filtering_condition: {e.msg}")
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            column_of(node.id)
+        elif isinstance(node, ast.Attribute):
+            owner = node.value.attr if isinstance(node.value, ast.Attribute) else None
+            if owner == "str":
+                allowed = CONDITION_STR_METHODS
+            elif owner == "dt":
+                allowed = CONDITION_DT_FIELDS
+            else:
+                allowed = CONDITION_METHODS
+            if node.attr not in allowed:
+                raise ValueError(f"filtering_condition may not use {node.attr!r}")
+        elif isinstance(node, ast.MatMult):
+            raise ValueError("filtering_condition may only refer to columns and literals")
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+            if is_text(node.left) or is_text(node.right):
+                raise ValueError("filtering_condition may not repeat strings")
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            exponent = node.right
+            if not (
+                isinstance(exponent, ast.Constant)
+                and isinstance(exponent.value, (int, float))
+                and abs(exponent.value) <= _MAX_EXPONENT
+            ):
+                raise ValueError(
+                    f"filtering_condition exponents must be numbers up to {_MAX_EXPONENT}"
+                )
 
 
 class QueryAnalysisOutput(BaseModel):
     """
-    This function extracts data from a given table based on a filtering condition.
+    Fast structured query over one table, run directly on the loaded data without starting Python.
+    Use it for simple lookups: filter rows, select columns, group by and aggregate, sort and keep the top N rows.
+    Use SQLAnalysis for joins and aggregates over several tables, and InventoryCodeInterpreter for custom computations.
     """
 
-    table_name: str = Field(..., description="Table to extract data from.")
-    filtering_condition: str = Field(
+    table_name: str = Field(..., description="Table (or child table) to query.")
+    filtering_condition: Optional[str] = Field(
+        None,
+        description="Optional pandas DataFrame.query() condition to filter rows, e.g. \"quantity < 10 and category == 'food'\". Column methods are limited to isin, between, isna, notna, abs, round, str.contains/startswith/endswith/lower/upper/len and dt fields (dt.year, dt.month, ...).",
+    )
+    columns: Optional[List[str]] = Field(
+        None, description="Columns to return when not aggregating. All columns if omitted."
+    )
+    group_by: Optional[List[str]] = Field(
+        None, description="Columns to group by before aggregating."
+    )
+    aggregations: Optional[Dict[str, AGGREGATIONS]] = Field(
+        None,
+        description="Aggregation per column, e.g. {\"total\": \"sum\", \"_id\": \"count\"}. Applied per group, or over the whole table without group_by.",
+    )
+    sort_by: Optional[List[str]] = Field(None, description="Columns to sort the result by.")
+    ascending: bool = Field(True, description="Sort order for sort_by.")
+    limit: int = Field(
+        QUERY_MAX_ROWS, description=f"Number of rows to return (top N), at most {QUERY_MAX_ROWS}."
+    )
+
+    def query(self, tables: dict) -> pd.DataFrame:
+        if self.table_name not in tables:
+            raise ValueError(f"Unknown table {self.table_name!r}")
+        df = tables[self.table_name]
+        if self.filtering_condition:
+            # Keep the condition to column expressions
+            _check_condition(self.filtering_condition, df)
+            df = df.query(self.filtering_condition, engine="python")
+        if self.aggregations and self.group_by:
+            df = df.groupby(self.group_by, dropna=False).agg(self.aggregations).reset_index()
+        elif self.aggregations:
+            df = df.agg(self.aggregations).to_frame().T.reset_index(drop=True)
+        elif self.columns:
+            df = df[self.columns]
+        if self.sort_by:
+            df = df.sort_values(self.sort_by, ascending=self.ascending)
+        return df
+
+    def run(self, tables: dict = None):
+        try:
+            result = self.query(DATA if tables is None else tables)
+            limit = max(1, min(self.limit, QUERY_MAX_ROWS))
+            return json.dumps(
+                {
+                    "row_count": len(result),
+                    "rows": json.loads(result.head(limit).to_json(orient="records", date_format="iso")),
+                }
+            )
+        except Exception as e:
+            return f"Error executing the query: {e}"
+
+
+class SQLAnalysis(BaseModel):
+    """
+    Run one read-only SQL SELECT (DuckDB dialect) directly on the stored tables, without starting Python.
+    Use it for aggregates, filters and joins over one or several tables: only the columns and rows the query needs are read.
+    Tables and columns have the names given in the table definitions; double-quote names that need it.
+    """
+
+    sql: str = Field(
         ...,
-        description="Filtering condition from the given table str to perform table_name.query('condition') in python. Python-like expressions for filtering",
+        description="A single SELECT (or WITH ... SELECT) statement, e.g. \"SELECT status, sum(total) FROM invoices GROUP BY status\".",
+    )
+    limit: int = Field(
+        QUERY_MAX_ROWS, description=f"Number of rows to return, at most {QUERY_MAX_ROWS}."
     )
 
-    def run(self):
-        return (
-            DATA[self.table_name]
-            .query(self.filtering_condition, engine="python")
-            .to_json(orient="records")
-        )
+    def connect(self, data_dir: str) -> duckdb.DuckDBPyConnection:
+        con = duckdb.connect(config={"threads": SQL_THREADS, "memory_limit": SQL_MEMORY_LIMIT})
+        for table_name in table_names(data_dir):
+            con.register(table_name, open_dataset(table_name, data_dir))
+        # Only the registered tables are reachable: no files, extensions or settings
+        con.execute("SET enable_external_access = false")
+        con.execute("SET lock_configuration = true")
+        return con
+
+    def run(self, data_dir: str = TABLES_DIR):
+        try:
+            statements = duckdb.extract_statements(self.sql)
+            if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+                raise ValueError("only a single SELECT statement is allowed")
+            limit = max(1, min(self.limit, QUERY_MAX_ROWS))
+            con = self.connect(data_dir)
+            timer = threading.Timer(SQL_TIMEOUT_SECONDS, con.interrupt)
+            timer.start()
+            try:
+                cursor = con.execute(self.sql)
+                columns = [column[0] for column in cursor.description]
+                rows = cursor.fetchmany(limit + 1)
+            finally:
+                timer.cancel()
+                con.close()
+            return json.dumps(
+                {"columns": columns, "rows": rows[:limit], "truncated": len(rows) > limit},
+                default=str,
+            )
+        except duckdb.InterruptException:
+            return (
+                "Error executing the SQL query: "
+                f"it ran for more than {SQL_TIMEOUT_SECONDS:g} s and was stopped"
+            )
+        except Exception as e:
+            return f"Error executing the SQL query: {e}"
 
 
 class InventoryCodeInterpreter(BaseModel):
@@ -54,18 +235,66 @@ class InventoryCodeInterpreter(BaseModel):
         description="Python code (can only use pandas and numpy libraries at most) to execute to respond to the question.The code should always finish with a print statement as a return.",
     )
 
-    def run(self):
+    def run(self, cwd: str = None):
         try:
-            # execute the python code in a subprocess and enforce error checking
-            output = subprocess.run(
-                [sys.executable, "-c", self.python_code],
-                capture_output=True,
-                check=True,  # this causes a CalledProcessError for non-zero exit codes
+            # Identical code over unchanged data gives the same output
+            workspace = os.path.abspath(cwd or os.getcwd())
+            cache_key = RESULT_CACHE.key(
+                self.python_code, workspace, data_version(os.path.join(workspace, TABLES_DIR))
             )
-            return output.stdout.decode()
-        except subprocess.CalledProcessError as e:
-            # Return the error message instead of raising an exception.
-            return f"Error executing the code: {e.stderr.decode()}"
+            if cache_key is not None:
+                cached = RESULT_CACHE.get(cache_key)
+                if cached is not None:
+                    return cached
+            # execute the python code on a warm sandbox worker
+            output = get_pool().run(self.python_code, cwd)
+            if output.limit is not None:
+                # A structured error the model can react to by making the code cheaper
+                return json.dumps(
+                    {
+                        "error": "resource_limit_exceeded",
+                        "limit": output.limit,
+                        "message": output.stderr,
+                        "hint": "Filter rows and select columns early, avoid cartesian merges, "
+                        "aggregate before printing, or use the rollup tables.",
+                        "partial_output": output.stdout,
+                    }
+                )
+            if output.returncode != 0:
+                # Return the error message instead of raising an exception.
+                return f"Error executing the code: {output.stderr}"
+            if cache_key is not None:
+                RESULT_CACHE.put(cache_key, output.stdout)
+            return output.stdout
         except Exception as e:
             # Return a generic error message.
             return f"An unexpected error occurred: {str(e)}"
+
+
+TOOL_CLASSES = {
+    tool.__name__: tool for tool in (InventoryCodeInterpreter, QueryAnalysisOutput, SQLAnalysis)
+}
+
+
+def parse_tool_call(name: str, arguments: str):
+    """
+    Return ``(tool, None)`` for a valid tool call of the model, or
+    ``(None, error)`` with the message to send back as the tool result when
+    the tool is unknown or its arguments are invalid.
+    """
+    if name not in TOOL_CLASSES:
+        return None, f"Unknown tool {name!r}"
+    try:
+        # NOTE: .parse_raw is deprecated in newer versions of Pydantic
+        return TOOL_CLASSES[name].parse_raw(arguments), None
+    except ValueError as e:
+        return None, f"Invalid arguments for {name}: {e}"
+
+
+def tool_arguments(arguments: str) -> dict:
+    """The arguments of a tool call as a dict, even when they are not valid JSON."""
+    try:
+        parsed = json.loads(arguments)
+    except ValueError:
+        return {"arguments": arguments}
+    return parsed if isinstance(parsed, dict) else {"arguments": parsed}
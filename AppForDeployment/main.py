@@ -1,26 +1,64 @@
+import asyncio
+import importlib
 import json
-import os
-from typing import List
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from openai import OpenAI
-from data_fetching import update_data, get_data
-from configs import SYSTEM_PROMPT, TABLES_DEFINITIONS
-from functions import InventoryCodeInterpreter
-from functools import lru_cache
+import metrics
+from metrics import CHAT_REQUESTS, CHAT_SECONDS
 
 
-app = FastAPI()
+load_dotenv()
+
+# pandas, openai and the data layer are only imported by this module, in the
+# background once the server is up, so /ping answers right away.
+SERVICE_MODULE = "chat_service"
+_service = None
+_warmup = {"ready": False, "error": None, "import_seconds": None, "sandbox_seconds": None}
+_service_lock = threading.Lock()
+
+
+def _import_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = importlib.import_module(SERVICE_MODULE)
+    return _service
+
+
+def _warm_up():
+    try:
+        started = time.perf_counter()
+        service = _import_service()
+        _warmup["import_seconds"] = round(time.perf_counter() - started, 3)
+        started = time.perf_counter()
+        service.warm_up()
+        _warmup["sandbox_seconds"] = round(time.perf_counter() - started, 3)
+        _warmup["ready"] = True
+    except Exception as e:
+        _warmup["error"] = str(e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+async def get_service():
+    """The chat service, imported here if a request comes before the warm-up is done."""
+    if _service is not None:
+        return _service
+    return await asyncio.to_thread(_import_service)
 
-# Global state variables
-_len_tokens = 0
-_instructions = ""
-OPENAI_MODEL = "gpt-4o"
-PRICE_PER_TOKEN = 2.5e-6
-TOKEN_LENGTH_RATIO = 1.3
-MAX_FUNCTION_CALL_ITERATIONS = 10
-client = None
 
 # Request/response models
 class Message(BaseModel):
@@ -33,123 +71,30 @@ class ChatRequest(BaseModel):
 
 class ChatResponse(BaseModel):
     response: str
+    usage: Optional[dict] = None
+    cached: bool = False
 
-def load_cached_data(user_id: str):
-    update_data(user_id)
-    return get_data()
-
-def initialize(user_id: str):
-    global _instructions, _len_tokens, client  
-
-    load_dotenv()
-    data = load_cached_data(user_id)
-
-    # Extract signatures from the fetched data
-    invoices_sig = data["invoices"][1]
-    items_sig = data["items"][1]
-    purchases_sig = data["purchases"][1]
-    suppliers_sig = data["suppliers"][1]
-    clients_sig = data["clients"][1]
-
-    # Build the system prompt using the provided configurations
-    _instructions = SYSTEM_PROMPT.format(
-        TABLES_DEFINITIONS=TABLES_DEFINITIONS.format(
-            clients_mapping=clients_sig,
-            items_mapping=items_sig,
-            suppleirs_mapping=suppliers_sig,
-            purrchases_mapping=purchases_sig,
-            invoices_mapping=invoices_sig,
-        )
-    )
+class InvalidateRequest(BaseModel):
+    user_id: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    user_id: str
 
-    _len_tokens = len(_instructions.split()) * TOKEN_LENGTH_RATIO
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-def chatbot_response(conversation_history: List[dict], user_id: str) -> str:
-    global _len_tokens, _instructions, client
-    """
-    Process a conversation history and return the chatbot's final response.
-    
-    The conversation_history should be a list of messages, where each message is a dict:
-        {"role": "user" or "assistant", "content": "Your message text"}
-    """
-    initialize(user_id)
-
-        
-
-    # Prepare messages starting with the system prompt
-    messages = [{"role": "system", "content": _instructions}] + conversation_history.copy()
-
-    iteration = 0
-    assistant_message = None
-
-    while iteration < MAX_FUNCTION_CALL_ITERATIONS:
-        # Call the OpenAI API with the current conversation messages
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=messages,
-            tools=[
-                {
-                    "type": "function",
-                    "function": {
-                        "name": InventoryCodeInterpreter.__class__.__name__,
-                        "description": InventoryCodeInterpreter.__class__.__doc__,
-                        "parameters": InventoryCodeInterpreter.schema(),
-                    },
-                }
-            ],
-            stream=False,
-            temperature=0,
-            parallel_tool_calls=False,
-        )
-
-        assistant_message = {
-            "role": "assistant",
-            "content": response.choices[0].message.content,
-            "tool_calls": response.choices[0].message.tool_calls,
-        }
-        messages.append(assistant_message)
-
-        # Update token count (simple estimation)
-        message_content = assistant_message["content"] or ""
-        _len_tokens += len(message_content.split()) * TOKEN_LENGTH_RATIO
-
-        # Process tool calls if any
-        if assistant_message["tool_calls"]:
-            tool_call = response.choices[0].message.tool_calls[0]
-            tc_args = tool_call.function.arguments
-            tc_id = tool_call.id
-
-            # Parse tool call arguments and run the tool
-            python_code_arg = json.loads(tc_args).get("python_code")
-            tool_result = InventoryCodeInterpreter.parse_raw(tc_args).run()
-
-            # Append the tool result as a new message
-            tool_result_message = {
-                "role": "tool",
-                "content": json.dumps({"python_code": python_code_arg, "result": tool_result}),
-                "tool_call_id": tc_id,
-            }
-            messages.append(tool_result_message)
-        else:
-            break
-
-        iteration += 1
-
-    return assistant_message["content"] if assistant_message else ""
 
 @app.get("/ping")
 def ping():
     return {"message": "pong"}
 
-@app.post("/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest):
-    """
-    FastAPI endpoint to process a chat request.
-    Expects a JSON payload with the conversation_history (list of messages)
-    and returns the final assistant response.
-    """
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the chat service is imported and a sandbox worker is up."""
+    return JSONResponse(_warmup, status_code=200 if _warmup["ready"] else 503)
+
+def validate_chat_request(request: ChatRequest, service):
     user_id = request.user_id
     conversation_history = [message.dict() for message in request.conversation_history]
     if not user_id:
@@ -157,7 +102,107 @@ def chat_endpoint(request: ChatRequest):
     if not conversation_history:
         raise HTTPException(status_code=400, detail="conversation_history cannot be empty.")
     try:
-        response_text = chatbot_response(conversation_history, user_id)
-        return ChatResponse(response=response_text)
+        service.user_workspace(user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return user_id, conversation_history
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(request: ChatRequest):
+    """
+    FastAPI endpoint to process a chat request.
+    Expects a JSON payload with the conversation_history (list of messages)
+    and returns the final assistant response.
+    """
+    service = await get_service()
+    user_id, conversation_history = validate_chat_request(request, service)
+    started = time.perf_counter()
+    try:
+        result = await service.chatbot_response(conversation_history, user_id)
+        CHAT_REQUESTS.inc(endpoint="chat", outcome="ok")
+        return ChatResponse(**result)
     except Exception as e:
+        CHAT_REQUESTS.inc(endpoint="chat", outcome="error")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        CHAT_SECONDS.observe(time.perf_counter() - started, endpoint="chat")
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Same as /chat, but streams server-sent events while the answer is built:
+    "token" events with assistant text as it arrives, "tool_call_start" and
+    "tool_call_end" around each tool run, then "done" (or "error").
+    """
+    service = await get_service()
+    user_id, conversation_history = validate_chat_request(request, service)
+
+    async def event_stream():
+        started = time.perf_counter()
+        try:
+            async for event, data in service.chat_events(conversation_history, user_id):
+                yield sse_event(event, data)
+            CHAT_REQUESTS.inc(endpoint="chat_stream", outcome="ok")
+        except Exception as e:
+            CHAT_REQUESTS.inc(endpoint="chat_stream", outcome="error")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            CHAT_SECONDS.observe(time.perf_counter() - started, endpoint="chat_stream")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text exposition of token, cost and latency metrics."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/cache/invalidate")
+async def invalidate_cache(request: InvalidateRequest):
+    """
+    Drop the cached dataset of one user (or of every user when user_id is
+    omitted) so the next /chat request reloads it from the last snapshot.
+    Use /refresh to sync from the gateway.
+    """
+    service = await get_service()
+    service.dataset_cache.invalidate(request.user_id)
+    service.answer_cache.invalidate(request.user_id)
+    return {"invalidated": request.user_id or "all"}
+
+@app.post("/refresh", status_code=202)
+async def refresh_endpoint(request: RefreshRequest):
+    """
+    Sync one user's tables from the gateway in the background. Requests keep
+    being answered from the current snapshot until the new one is published.
+    """
+    service = await get_service()
+    try:
+        service.user_workspace(request.user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    service.refresher.submit(request.user_id)
+    return {"scheduled": request.user_id}
+
+@app.get("/refresh/status")
+async def refresh_status():
+    """Last refresh time, last error and in-flight state of every scheduled user."""
+    service = await get_service()
+    return service.refresher.status()
+
+@app.get("/memory/{user_id}")
+async def table_memory(user_id: str):
+    """Memory saved per table by the dtype optimization of the last sync."""
+    service = await get_service()
+    try:
+        return service.workspace_memory(user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss statistics of the answer cache in this worker."""
+    service = await get_service()
+    return service.answer_cache.stats()
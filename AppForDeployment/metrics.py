@@ -0,0 +1,159 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters and histograms are process-wide and thread-safe; `render()` returns
+every registered metric in the Prometheus text format served on /metrics.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# gpt-4o list prices, in USD per token
+PRICE_PER_PROMPT_TOKEN = 2.5e-6
+PRICE_PER_CACHED_PROMPT_TOKEN = 1.25e-6
+PRICE_PER_COMPLETION_TOKEN = 1e-5
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self) -> dict:
+        """Return ``{labels: (count, sum)}`` for every observed series."""
+        with self._lock:
+            return {key: (series[-2], series[-1]) for key, series in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted((k, list(v)) for k, v in self._series.items())
+        for key, series in series_items:
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(key + (("le", bound),))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "supplyz_stage_seconds",
+    "Latency of the pipeline stages: gateway_fetch, flatten, table_io, refresh, llm, query, sql, sandbox.",
+)
+LLM_TOKENS = Counter("supplyz_llm_tokens_total", "OpenAI tokens by kind, from completion usage.")
+LLM_COST = Counter("supplyz_llm_cost_usd_total", "Estimated OpenAI cost in USD.")
+LLM_CALLS = Counter("supplyz_llm_calls_total", "Chat completion calls made.")
+CHAT_REQUESTS = Counter("supplyz_chat_requests_total", "Chat requests handled, by outcome.")
+CHAT_SECONDS = Histogram("supplyz_chat_request_seconds", "End-to-end latency of chat requests.")
+RESULT_CACHE_LOOKUPS = Counter(
+    "supplyz_result_cache_lookups_total", "Code interpreter result cache lookups, by outcome."
+)
+ANSWER_CACHE_LOOKUPS = Counter(
+    "supplyz_answer_cache_lookups_total", "Chat answer cache lookups, by outcome."
+)
+REFRESHES = Counter("supplyz_refreshes_total", "Background table refreshes, by outcome.")
+SANDBOX_LIMITS = Counter(
+    "supplyz_sandbox_limit_exceeded_total", "Sandbox runs stopped by a resource limit, by limit."
+)
+
+
+def usage_to_dict(usage) -> dict:
+    """Token counts of an OpenAI `usage` object, including cached prompt tokens."""
+    if usage is None:
+        return {"prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_prompt_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "completion_tokens": usage.completion_tokens,
+    }
+
+
+def usage_cost(usage: dict) -> float:
+    uncached = usage["prompt_tokens"] - usage["cached_prompt_tokens"]
+    return (
+        uncached * PRICE_PER_PROMPT_TOKEN
+        + usage["cached_prompt_tokens"] * PRICE_PER_CACHED_PROMPT_TOKEN
+        + usage["completion_tokens"] * PRICE_PER_COMPLETION_TOKEN
+    )
+
+
+def record_llm_usage(usage: dict) -> float:
+    """Add one completion's usage to the counters and return its cost."""
+    cost = usage_cost(usage)
+    LLM_CALLS.inc()
+    LLM_TOKENS.inc(usage["prompt_tokens"] - usage["cached_prompt_tokens"], kind="prompt")
+    LLM_TOKENS.inc(usage["cached_prompt_tokens"], kind="cached_prompt")
+    LLM_TOKENS.inc(usage["completion_tokens"], kind="completion")
+    LLM_COST.inc(cost)
+    return cost
@@ -0,0 +1,479 @@
+"""
+Pool of pre-warmed Python worker processes used to execute generated code.
+
+Each worker is a fork server: an interpreter that imports pandas and numpy
+once at start-up and then, for every snippet sent over its pipe, forks a
+fresh child that runs the snippet in a new ``__main__`` namespace with a
+``load_table(name)`` helper pre-bound. The worker itself never runs user
+code, so nothing a snippet does (globals, builtins, module state, options)
+survives into the next run, while every run still starts warm.
+
+The child's file descriptors 1 and 2 are pipes read by the worker, so output
+written by C code, ``os.system`` or subprocesses is captured just as with
+``python -c``, and ``os._exit`` keeps what was printed and its exit status.
+
+Every run is bounded by a wall-clock timeout (the child's process group is
+killed), a CPU-time budget (RLIMIT_CPU), an address-space cap (RLIMIT_AS)
+and a maximum output size. A run stopped by a limit comes back with the
+name of that limit in ``SandboxResult.limit``.
+"""
+
+import atexit
+import json
+import os
+import queue
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from metrics import SANDBOX_LIMITS, STAGE_SECONDS
+
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "2"))
+# How long a run waits for an idle worker before giving up
+SANDBOX_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv("SANDBOX_ACQUIRE_TIMEOUT_SECONDS", "60"))
+# Per-run limits; 0 disables a limit
+SANDBOX_TIMEOUT_SECONDS = float(os.getenv("SANDBOX_TIMEOUT_SECONDS", "60"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "30"))
+# Address space a run may add on top of the warm worker's own
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "2048"))
+SANDBOX_MAX_OUTPUT_CHARS = int(os.getenv("SANDBOX_MAX_OUTPUT_CHARS", str(256 * 1024)))
+PRELOAD_MODULES = ("numpy", "pandas", "pyarrow")
+TABLES_DIR = "data"
+# Extra time the pool gives a worker past the run timeout before killing it
+_WORKER_GRACE_SECONDS = 10
+_SPAWN_MAX_BACKOFF_SECONDS = 30
+
+LIMIT_MESSAGES = {
+    "wall_time": f"The code ran for more than {SANDBOX_TIMEOUT_SECONDS:g} s and was stopped.",
+    "cpu_time": f"The code used more than {SANDBOX_CPU_SECONDS} s of CPU time and was stopped.",
+    "memory": f"The code needed more than {SANDBOX_MEMORY_MB} MB of memory and was stopped.",
+    "output": f"The code printed more than {SANDBOX_MAX_OUTPUT_CHARS} characters and was stopped.",
+}
+
+
+class SandboxResult:
+    def __init__(self, returncode: int, stdout: str, stderr: str, limit: str = None):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        # "wall_time", "cpu_time", "memory" or "output" when a limit stopped the run
+        self.limit = limit
+
+
+class SandboxWorker:
+    """A single warm fork server speaking a JSON-lines protocol."""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+            # Its own process group, so killing it also kills a running child
+            start_new_session=True,
+        )
+        # Block until the preload imports are done so the worker is warm.
+        if not self.proc.stdout.readline():
+            self.proc.wait()
+            raise RuntimeError(f"Sandbox worker failed to start (exit code {self.proc.returncode})")
+
+    def execute(self, code: str, cwd: str = None) -> SandboxResult:
+        try:
+            self.proc.stdin.write(json.dumps({"code": code, "cwd": cwd}) + "\n")
+            self.proc.stdin.flush()
+            # The worker enforces the run timeout itself; this only catches a stuck worker
+            timeout = None
+            if SANDBOX_TIMEOUT_SECONDS:
+                timeout = SANDBOX_TIMEOUT_SECONDS + _WORKER_GRACE_SECONDS
+            if not select.select([self.proc.stdout], [], [], timeout)[0]:
+                self.close()
+                return SandboxResult(1, "", LIMIT_MESSAGES["wall_time"], "wall_time")
+            line = self.proc.stdout.readline()
+        except (BrokenPipeError, OSError):
+            line = ""
+        if not line:
+            returncode = self.proc.wait()
+            return SandboxResult(1, "", f"Sandbox worker exited with code {returncode}")
+        reply = json.loads(line)
+        return SandboxResult(reply["returncode"], reply["stdout"], reply["stderr"], reply["limit"])
+
+    def is_alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.proc.wait()
+
+
+class SandboxPool:
+    """
+    Hands snippets to idle warm workers. Callers wait up to
+    SANDBOX_ACQUIRE_TIMEOUT_SECONDS for a free worker; dead workers are
+    replaced in the background so nobody waits on start-up, and a worker that
+    fails to start is retried with backoff.
+    """
+
+    def __init__(self, size: int = SANDBOX_POOL_SIZE):
+        self.size = max(1, size)
+        self._idle = queue.Queue()
+        self._closed = False
+        # Why the last worker failed to start, until one starts again
+        self.spawn_error = None
+        for _ in range(self.size):
+            self._spawn_async()
+
+    def _spawn(self):
+        delay = 1
+        while not self._closed:
+            try:
+                worker = SandboxWorker()
+            except Exception as e:
+                self.spawn_error = str(e) or type(e).__name__
+                time.sleep(delay)
+                delay = min(delay * 2, _SPAWN_MAX_BACKOFF_SECONDS)
+                continue
+            self.spawn_error = None
+            if self._closed:
+                worker.close()
+            else:
+                self._idle.put(worker)
+            return
+
+    def _spawn_async(self):
+        threading.Thread(target=self._spawn, daemon=True).start()
+
+    def run(self, code: str, cwd: str = None) -> SandboxResult:
+        with STAGE_SECONDS.time(stage="sandbox"):
+            result = self._run(code, cwd)
+        if result.limit is not None:
+            SANDBOX_LIMITS.inc(limit=result.limit)
+        return result
+
+    def _run(self, code: str, cwd: str = None) -> SandboxResult:
+        try:
+            worker = self._idle.get(timeout=SANDBOX_ACQUIRE_TIMEOUT_SECONDS or None)
+        except queue.Empty:
+            message = f"No sandbox worker free after {SANDBOX_ACQUIRE_TIMEOUT_SECONDS:g} s"
+            if self.spawn_error:
+                message += f": {self.spawn_error}"
+            return SandboxResult(1, "", message)
+        try:
+            return worker.execute(code, cwd)
+        finally:
+            if worker.is_alive() and not self._closed:
+                self._idle.put(worker)
+            else:
+                worker.close()
+                self._spawn_async()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+# Memory-mapped Arrow tables of this run, keyed by absolute path -> (mtime_ns, table)
+_mapped_tables = {}
+
+
+def load_table(name: str, columns: list = None):
+    """
+    Return the synced table `name` as a DataFrame. The Arrow snapshot is
+    memory-mapped once per run; only the selected columns are converted.
+    """
+    import pyarrow as pa
+
+    path = os.path.abspath(os.path.join(TABLES_DIR, f"{name}.arrow"))
+    mtime_ns = os.stat(path).st_mtime_ns
+    cached = _mapped_tables.get(path)
+    if cached is None or cached[0] != mtime_ns:
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        _mapped_tables[path] = cached = (mtime_ns, table)
+    table = cached[1]
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas()
+
+
+class LimitExceeded(BaseException):
+    """Raised inside a snippet when it goes over a limit; not an Exception, so
+    a bare ``except Exception`` in user code does not swallow it."""
+
+    def __init__(self, limit: str):
+        super().__init__(LIMIT_MESSAGES[limit])
+        self.limit = limit
+
+
+def _on_cpu_limit(signum, frame):
+    raise LimitExceeded("cpu_time")
+
+
+def _set_cpu_limit():
+    """
+    A forked child starts with no CPU time used. Past the soft limit the
+    kernel sends SIGXCPU, which stops the snippet at its next bytecode; one
+    second later the hard limit kills code stuck in C.
+    """
+    import resource
+
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = SANDBOX_CPU_SECONDS
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+        hard = min(soft + 1, hard)
+    else:
+        hard = soft + 1
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _set_memory_cap():
+    """Cap the address space at the warm worker's own plus SANDBOX_MEMORY_MB."""
+    import resource
+
+    try:
+        with open("/proc/self/status") as f:
+            vm_kb = next(int(line.split()[1]) for line in f if line.startswith("VmSize:"))
+    except (OSError, StopIteration):
+        return
+    limit = vm_kb * 1024 + SANDBOX_MEMORY_MB * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _run_child(job: dict, status_fd: int) -> int:
+    """Run the snippet in the forked child and return its exit status."""
+    import builtins
+    import io
+    import traceback
+
+    # Line-buffered like a terminal, so what was printed before os._exit is kept
+    sys.stdout = io.TextIOWrapper(
+        io.BufferedWriter(io.FileIO(1, "w", closefd=False)), "utf-8", line_buffering=True
+    )
+    sys.stderr = io.TextIOWrapper(
+        io.BufferedWriter(io.FileIO(2, "w", closefd=False)),
+        "utf-8",
+        "backslashreplace",
+        line_buffering=True,
+    )
+    sys.stdin = open(os.devnull)
+    if "numpy" in sys.modules:
+        # Otherwise every child would draw the worker's random sequence
+        sys.modules["numpy"].random.seed()
+    namespace = {
+        "__name__": "__main__",
+        "__builtins__": builtins,
+        "load_table": load_table,
+    }
+    limit = None
+    returncode = 0
+    try:
+        if job.get("cwd"):
+            os.chdir(job["cwd"])
+        if SANDBOX_MEMORY_MB:
+            _set_memory_cap()
+        if SANDBOX_CPU_SECONDS:
+            _set_cpu_limit()
+        exec(compile(job["code"], "<string>", "exec"), namespace)
+    except LimitExceeded as e:
+        limit = e.limit
+        returncode = 1
+    except MemoryError:
+        limit = "memory"
+        returncode = 1
+    except SystemExit as e:
+        # Mirror how `python -c` turns SystemExit into an exit status.
+        if e.code is None:
+            returncode = 0
+        elif isinstance(e.code, int):
+            returncode = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            returncode = 1
+    except BaseException:
+        etype, value, tb = sys.exc_info()
+        # Drop this frame so the traceback matches a plain `python -c` run.
+        traceback.print_exception(etype, value, tb.tb_next)
+        returncode = 1
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+    if limit is not None:
+        os.write(status_fd, limit.encode())
+    return returncode
+
+
+def _read_output(pid: int, fds: dict, deadline: float):
+    """
+    Read the child's stdout and stderr pipes until both are closed. Returns
+    ``({fd: bytes}, limit)``; the child is killed when it runs past
+    `deadline` or prints more than the output limit.
+    """
+    chunks = {fd: bytearray() for fd in fds}
+    open_fds = list(fds)
+    limit = None
+    while open_fds and limit is None:
+        timeout = None if deadline is None else deadline - time.monotonic()
+        if timeout is not None and timeout <= 0:
+            limit = "wall_time"
+            break
+        for fd in select.select(open_fds, [], [], timeout)[0]:
+            data = os.read(fd, 65536)
+            if not data:
+                open_fds.remove(fd)
+                continue
+            buffer = chunks[fd]
+            room = SANDBOX_MAX_OUTPUT_CHARS - len(buffer) if SANDBOX_MAX_OUTPUT_CHARS else len(data)
+            buffer += data[: max(0, room)]
+            # Too much stdout stops the run; extra stderr is only dropped
+            if len(data) > room and fds[fd] == "stdout":
+                limit = "output"
+    if limit is not None:
+        _kill_group(pid)
+    return chunks, limit
+
+
+def _wait_child(pid: int, deadline: float):
+    """Reap the child, killing it at `deadline`; returns ``(status, rusage, timed_out)``."""
+    delay = 0.001
+    while deadline is None or time.monotonic() < deadline:
+        reaped, status, rusage = os.wait4(pid, os.WNOHANG)
+        if reaped:
+            return status, rusage, False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+    _kill_group(pid)
+    _, status, rusage = os.wait4(pid, 0)
+    return status, rusage, True
+
+
+def _kill_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _execute_job(job: dict, keep_fds: tuple) -> dict:
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    status_r, status_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        returncode = 1
+        try:
+            # Its own process group, so a limit also stops what the snippet started
+            os.setpgid(0, 0)
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(out_w, 1)
+            os.dup2(err_w, 2)
+            for fd in (devnull, out_r, out_w, err_r, err_w, status_r, *keep_fds):
+                os.close(fd)
+            returncode = _run_child(job, status_w)
+        finally:
+            os._exit(returncode & 0xFF)
+
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        pass
+    for fd in (out_w, err_w, status_w):
+        os.close(fd)
+    deadline = time.monotonic() + SANDBOX_TIMEOUT_SECONDS if SANDBOX_TIMEOUT_SECONDS else None
+    try:
+        chunks, limit = _read_output(pid, {out_r: "stdout", err_r: "stderr"}, deadline)
+        status, rusage, timed_out = _wait_child(pid, deadline)
+        # Leftovers the snippet started in the background
+        _kill_group(pid)
+        os.set_blocking(status_r, False)
+        try:
+            reported = os.read(status_r, 64).decode()
+        except BlockingIOError:
+            reported = ""
+    finally:
+        for fd in (out_r, err_r, status_r):
+            os.close(fd)
+
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    if limit is None and timed_out:
+        limit = "wall_time"
+    if limit is None and reported in LIMIT_MESSAGES:
+        limit = reported
+    if (
+        limit is None
+        and SANDBOX_CPU_SECONDS
+        and os.WIFSIGNALED(status)
+        and rusage.ru_utime + rusage.ru_stime >= SANDBOX_CPU_SECONDS
+    ):
+        # Killed by the hard CPU limit while stuck in C
+        limit = "cpu_time"
+    stdout = chunks[out_r].decode("utf-8", "replace")
+    stderr = chunks[err_r].decode("utf-8", "replace")
+    return {
+        "returncode": 1 if limit else returncode,
+        "stdout": stdout,
+        "stderr": LIMIT_MESSAGES[limit] if limit else stderr,
+        "limit": limit,
+    }
+
+
+def _worker_main():
+    import gc
+    import importlib
+
+    # Keep a private handle on the pipe and point fd 1 at /dev/null so that
+    # stray writes of the worker cannot corrupt the protocol stream.
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    requests_in = sys.stdin
+
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    # The preloaded objects stay shared with the children instead of being copied
+    gc.collect()
+    gc.freeze()
+    protocol.write(json.dumps({"ready": True}) + "\n")
+
+    for line in requests_in:
+        reply = _execute_job(json.loads(line), (protocol.fileno(),))
+        protocol.write(json.dumps(reply) + "\n")
+
+
+if __name__ == "__main__":
+    _worker_main()
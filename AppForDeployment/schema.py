@@ -0,0 +1,101 @@
+"""
+Compact table schemas for the system prompt.
+
+``compact_schema(df)`` describes a table with one line per column:
+short type codes instead of dtype reprs, index-suffixed column families
+(``lines_0_qty`` .. ``lines_7_qty``) collapsed into a single pattern line,
+and the distinct values of low-cardinality text columns.
+"""
+
+import re
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+# Low-cardinality text columns list their values when there are at most this many
+MAX_LISTED_VALUES = 8
+MAX_VALUE_LENGTH = 30
+
+_INDEX_SEGMENT = re.compile(r"(?<=_)\d+(?=_|$)")
+
+
+def _type_code(series: pd.Series) -> str:
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "int"
+    if pd.api.types.is_float_dtype(dtype):
+        return "float"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    if isinstance(dtype, pd.CategoricalDtype):
+        return "cat"
+    kinds = {type(value) for value in series.dropna()}
+    if not kinds:
+        return "empty"
+    if kinds == {str}:
+        return "str"
+    if kinds <= {list, tuple, np.ndarray}:
+        return "list"
+    if kinds <= {int, float}:
+        return "float"
+    return "mixed"
+
+
+def _values_hint(series: pd.Series) -> str:
+    """The distinct values of a low-cardinality text column, if that helps."""
+    values = series.dropna()
+    if values.empty:
+        return ""
+    try:
+        distinct = values.unique()
+    except TypeError:
+        return ""
+    if len(distinct) > MAX_LISTED_VALUES or len(distinct) * 2 > len(values):
+        return ""
+    if any(len(str(value)) > MAX_VALUE_LENGTH for value in distinct):
+        return ""
+    return " {" + ", ".join(sorted(map(str, distinct))) + "}"
+
+
+def _family_pattern(name: str):
+    """`lines_3_item_sku` -> (`lines_{}_item_sku`, (3,)); None if no index."""
+    indexes = tuple(int(i) for i in _INDEX_SEGMENT.findall(name))
+    if not indexes:
+        return None
+    return _INDEX_SEGMENT.sub("{}", name), indexes
+
+
+def compact_schema(df: pd.DataFrame) -> str:
+    families = defaultdict(list)
+    for name in df.columns:
+        parsed = _family_pattern(str(name))
+        if parsed is not None:
+            families[parsed[0]].append((name, parsed[1]))
+
+    lines = []
+    seen = set()
+    for name in df.columns:
+        parsed = _family_pattern(str(name))
+        members = families[parsed[0]] if parsed is not None else []
+        if len(members) < 2:
+            series = df[name]
+            hint = _values_hint(series) if _type_code(series) in ("str", "cat") else ""
+            lines.append(f"{name}: {_type_code(series)}{hint}")
+            continue
+        if parsed[0] in seen:
+            continue
+        seen.add(parsed[0])
+        # One line for the family, e.g. `lines_{0..7}_qty: int`
+        ranges = [
+            f"{{{min(ix)}..{max(ix)}}}" if min(ix) != max(ix) else str(ix[0])
+            for ix in zip(*(indexes for _, indexes in members))
+        ]
+        stacked = pd.concat([df[column] for column, _ in members], ignore_index=True)
+        codes = sorted({_type_code(df[column]) for column, _ in members} - {"empty"})
+        type_code = "|".join(codes) or "empty"
+        hint = _values_hint(stacked) if type_code in ("str", "cat") else ""
+        lines.append(f"{parsed[0].format(*ranges)}: {type_code}{hint}")
+    return "\n".join(lines)
@@ -0,0 +1,26 @@
+import asyncio
+import json
+
+from answer_cache import AnswerCache
+from chat_service import ChatSession, _run_tool
+from dataset_cache import DatasetEntry
+
+
+def _key(question: str) -> str:
+    return AnswerCache.key("u1", [{"role": "user", "content": question}], "v1", "gpt-4o")
+
+
+def test_whitespace_is_folded():
+    assert _key("Stock of  SKU1?\n") == _key("Stock of SKU1?")
+
+
+def test_case_is_kept():
+    assert _key("Stock of SKU1?") != _key("Stock of sku1?")
+
+
+def test_answers_built_on_volatile_tool_calls_are_not_replayed(tmp_path):
+    session = ChatSession("u1", DatasetEntry({}, "", str(tmp_path), "v1"), [])
+    asyncio.run(_run_tool(session, "SQLAnalysis", json.dumps({"sql": "SELECT 1"})))
+    assert not session.volatile
+    asyncio.run(_run_tool(session, "SQLAnalysis", json.dumps({"sql": "SELECT current_date"})))
+    assert session.volatile
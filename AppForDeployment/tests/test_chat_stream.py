@@ -0,0 +1,41 @@
+import asyncio
+from types import SimpleNamespace
+
+import chat_service
+from dataset_cache import DatasetEntry
+
+
+def _chunk(content=None, usage=None):
+    delta = SimpleNamespace(content=content, tool_calls=None)
+    choices = [SimpleNamespace(delta=delta)] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class _FakeCompletions:
+    async def create(self, **kwargs):
+        async def stream():
+            for content in ("The ", "stock ", "is 42."):
+                yield _chunk(content)
+            yield _chunk(usage=SimpleNamespace(prompt_tokens=10, completion_tokens=3))
+
+        return stream()
+
+
+def test_a_slow_client_does_not_hold_an_llm_slot(monkeypatch, tmp_path):
+    entry = DatasetEntry({}, "", str(tmp_path), "v1")
+    monkeypatch.setattr(chat_service, "current_dataset", lambda user_id: entry)
+    monkeypatch.setattr(chat_service.refresher, "touch", lambda user_id: None)
+    monkeypatch.setattr(chat_service, "answer_cache", chat_service.make_answer_cache("none"))
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=_FakeCompletions()))
+    monkeypatch.setattr(chat_service, "client", fake_client)
+
+    async def run():
+        events = chat_service.chat_events([{"role": "user", "content": "Stock?"}], "u1")
+        assert await anext(events) == ("token", {"content": "The "})
+        # The client stalls: the completion still finishes and frees its slot
+        await asyncio.sleep(0.05)
+        assert chat_service._llm_semaphore._value == chat_service.LLM_CONCURRENCY
+        rest = [event async for event in events]
+        assert rest[-1][1]["response"] == "The stock is 42."
+
+    asyncio.run(run())
@@ -0,0 +1,113 @@
+from urllib.parse import urlsplit
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import data_fetching
+from benchmarks import fake_gateway
+
+
+class FakeResponse:
+    def __init__(self, records, etag):
+        self.status_code = 200
+        self.records = records
+        self.headers = {"ETag": etag}
+
+    def json(self):
+        return {"data": self.records}
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    """Responses handed out in order by the patched _gateway_get, with the params of each request."""
+    responses, requests = [], []
+
+    def fake_gateway_get(url, user_id, token, headers=None, params=None):
+        requests.append(params or {})
+        return responses.pop(0)
+
+    monkeypatch.setattr(data_fetching, "_gateway_get", fake_gateway_get)
+    return responses, requests
+
+
+def _item(number: int, updated_at: str, quantity: int = 1) -> dict:
+    return {
+        "_id": f"item{number}",
+        "category": "food",
+        "quantity": quantity,
+        "price": 2.5,
+        "updated_at": updated_at,
+    }
+
+
+def test_delta_sync_over_optimized_tables(gateway, tmp_path):
+    responses, requests = gateway
+    data_dir = str(tmp_path)
+    responses.append(
+        FakeResponse([_item(i, f"2024-01-0{i}T10:00:00Z") for i in (1, 2, 3)], '"v1"')
+    )
+    state = data_fetching.sync_table("items", "u1", "token", data_dir, {})
+    stored = pd.read_parquet(tmp_path / "items.parquet")
+    assert pd.api.types.is_datetime64_any_dtype(stored["updated_at"])
+
+    # Two deltas in a row, each upserted into the optimized stored table
+    responses.append(FakeResponse([_item(2, "2024-01-04T10:00:00Z", quantity=7)], '"v2"'))
+    state = data_fetching.sync_table("items", "u1", "token", data_dir, state)
+    responses.append(FakeResponse([_item(4, "2024-01-05T10:00:00Z")], '"v3"'))
+    data_fetching.sync_table("items", "u1", "token", data_dir, state)
+
+    assert requests[1:] == [
+        {"updated_since": "2024-01-03T10:00:00Z"},
+        {"updated_since": "2024-01-04T10:00:00Z"},
+    ]
+    stored = pd.read_parquet(tmp_path / "items.parquet").set_index("_id").sort_index()
+    assert list(stored.index) == ["item1", "item2", "item3", "item4"]
+    assert stored.loc["item2", "quantity"] == 7
+    assert pd.api.types.is_datetime64_any_dtype(stored["updated_at"])
+    assert stored.loc["item4", "updated_at"] == pd.Timestamp("2024-01-05 10:00:00")
+
+
+def _serve(monkeypatch, app) -> TestClient:
+    """Route the gateway requests of data_fetching to the fake gateway `app`."""
+    client = TestClient(app)
+
+    def gateway_get(url, user_id, token, headers=None, params=None):
+        resp = client.get(urlsplit(url).path, headers=headers, params=params)
+        resp.raise_for_status()
+        return resp
+
+    monkeypatch.setattr(data_fetching, "_gateway_get", gateway_get)
+    return client
+
+
+def test_inclusive_updated_since_upserts_the_boundary_records(monkeypatch, tmp_path):
+    app = fake_gateway.create_app(records=100, depth=1)
+    client = _serve(monkeypatch, app)
+    data_dir = str(tmp_path)
+    state = data_fetching.sync_table("items", "u1", "token", data_dir, {})
+    stored = pd.read_parquet(tmp_path / "items.parquet")
+
+    client.post("/tables/items", json={"_id": "item3", "name": "item 3", "quantity": 999})
+    state = data_fetching.sync_table("items", "u1", "token", data_dir, state)
+
+    # The gateway sent the records stamped with the mark again, next to the change
+    assert app.state.requests["deltas"] == 1
+    updated = pd.read_parquet(tmp_path / "items.parquet").set_index("_id")
+    assert sorted(updated.index) == sorted(stored["_id"])
+    assert updated.loc["item3", "quantity"] == 999
+
+
+def test_gateway_ignoring_updated_since_replaces_the_table(monkeypatch, tmp_path):
+    app = fake_gateway.create_app(records=100, depth=1, honour_updated_since=False)
+    client = _serve(monkeypatch, app)
+    data_dir = str(tmp_path)
+    state = data_fetching.sync_table("items", "u1", "token", data_dir, {})
+
+    client.post("/tables/items", json={"_id": "item_new", "name": "new item", "quantity": 1})
+    data_fetching.sync_table("items", "u1", "token", data_dir, state)
+
+    # The records older than the mark show a full copy, new record included
+    updated = pd.read_parquet(tmp_path / "items.parquet")
+    assert len(updated) == len(app.state.tables["items"])
+    assert "item_new" in set(updated["_id"])
@@ -0,0 +1,17 @@
+import pandas as pd
+
+from dtype_optimizer import optimize_dtypes
+
+
+def test_numeric_measures_are_not_narrowed():
+    df = optimize_dtypes(
+        pd.DataFrame({"quantity": [60000.0, 1.0], "price": [50000.0, 2.0], "count": [3, 4]})
+    )
+    assert (df["quantity"] * df["price"]).tolist() == [3_000_000_000, 2]
+    assert df["count"].dtype == "int64"
+
+
+def test_integral_floats_with_gaps_become_nullable_integers():
+    df = optimize_dtypes(pd.DataFrame({"number": [1.0, None, 3.0], "total": [1.5, None, 2.0]}))
+    assert df["number"].dtype == "Int64"
+    assert df["total"].dtype == "float64"
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from data_fetching import flatten_json
+from flattening import flatten_records, normalize_records
+
+
+def test_line_records_become_a_child_table():
+    records = [
+        {"_id": "i1", "customer": {"name": "A"}, "lines": [{"sku": "x", "qty": 1}, {"sku": "y", "qty": 2}]},
+        {"_id": "i2", "customer": {"name": "B"}, "lines": [{"sku": "z", "qty": 3}]},
+    ]
+    tables = normalize_records("invoices", records)
+
+    assert list(tables["invoices"].columns) == ["_id", "customer_name"]
+    lines = tables["invoice_lines"]
+    assert lines["invoice_id"].tolist() == ["i1", "i1", "i2"]
+    assert lines["position"].tolist() == [0, 1, 0]
+    assert lines["sku"].tolist() == ["x", "y", "z"]
+
+
+def test_line_fields_named_like_the_link_columns_are_kept_apart():
+    records = [
+        {"_id": "i1", "lines": [{"invoice_id": "i1", "position": 5}, {"invoice_id": "i1", "position": 6}]},
+        {"_id": "i2", "lines": [{"invoice_id": "i2", "position": 1}]},
+    ]
+    lines = normalize_records("invoices", records)["invoice_lines"]
+
+    assert list(lines.columns) == ["invoice_id", "position", "position_record"]
+    assert lines["invoice_id"].tolist() == ["i1", "i1", "i2"]
+    assert lines["position"].tolist() == [0, 1, 0]
+    assert lines["position_record"].tolist() == [5, 6, 1]
+
+
+def test_clashing_names_fall_back_to_record_order():
+    records = [
+        {"_id": "i1", "a_b": 1, "a": {"b": 2}, "lines": [{"qty": 1}]},
+        {"_id": "i2", "a": {"b": 3}, "a_b": 4, "lines": [{"qty": 2}, {"qty": 3}]},
+    ]
+    expected = pd.DataFrame([flatten_json(r) for r in records])
+    pd.testing.assert_frame_equal(flatten_records(records), expected)
+
+    tables = normalize_records("invoices", records)
+    assert tables["invoices"]["a_b"].tolist() == [2, 4]
+    assert tables["invoice_lines"]["invoice_id"].tolist() == ["i1", "i2", "i2"]
+    assert tables["invoice_lines"]["qty"].tolist() == [1, 2, 3]
@@ -0,0 +1,55 @@
+import json
+
+import pandas as pd
+import pytest
+
+from functions import QueryAnalysisOutput
+
+TABLES = {
+    "invoices": pd.DataFrame(
+        {
+            "_id": ["i1", "i2"],
+            "client__id": ["client3", "client1"],
+            "total": [10.0, 20.0],
+            "date": pd.to_datetime(["2024-01-15", "2024-02-15"]),
+        }
+    )
+}
+
+
+def _run(condition: str) -> str:
+    return QueryAnalysisOutput(table_name="invoices", filtering_condition=condition).run(TABLES)
+
+
+@pytest.mark.parametrize(
+    "condition",
+    [
+        "client__id == 'client3'",
+        "client__id.str.endswith('3')",
+        "client__id.isin(['client3'])",
+        "date.dt.month == 1",
+        "total.between(5, 15)",
+    ],
+)
+def test_allowed_conditions(condition):
+    result = json.loads(_run(condition))
+    assert [row["_id"] for row in result["rows"]] == ["i1"]
+
+
+@pytest.mark.parametrize(
+    "condition",
+    [
+        "__import__('os').system('ls')",
+        "total.__class__ == 1",
+        "total > @limit",
+        "unknown == 1",
+        "client__id.to_csv('{path}') == 1",
+        "client__id.str.repeat(10**9) == 'a'",
+        "client__id == 'a' * 10**9",
+        "total ** 10**10 > 1",
+    ],
+)
+def test_condition_outside_the_columns_is_rejected(condition, tmp_path):
+    path = tmp_path / "pwned.csv"
+    assert _run(condition.format(path=path)).startswith("Error executing the query")
+    assert not path.exists()
@@ -0,0 +1,18 @@
+import time
+
+from refresh import RefreshScheduler
+
+
+def test_idle_tenants_are_no_longer_refreshed():
+    scheduler = RefreshScheduler(lambda tenant: None, interval_seconds=60, idle_seconds=3600)
+    scheduler.touch("active", last_refresh=0)
+    scheduler.touch("idle", last_refresh=0)
+    scheduler._tenants["idle"]["last_seen"] = time.time() - 7200
+
+    assert scheduler.drop_idle() == ["idle"]
+    assert scheduler.due() == ["active"]
+
+    # A new request puts it back on the schedule
+    scheduler.touch("idle")
+    assert sorted(scheduler.due()) == ["active", "idle"]
+    scheduler.stop()
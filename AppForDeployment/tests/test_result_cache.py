@@ -0,0 +1,43 @@
+import pytest
+
+from result_cache import ResultCache, is_volatile_sql
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import pandas as pd\nprint(pd.Timestamp.today())",
+        "import pandas as pd\nprint(pd.Timestamp('today'))",
+        "import datetime\nprint(datetime.datetime.now())",
+        "from datetime import date\nprint(date.today())",
+        "import numpy as np\nprint(np.random.rand())",
+        "import random\nprint(random.random())",
+        "print(load_table('items').sample(3))",
+    ],
+)
+def test_code_reading_the_clock_or_randomness_is_not_cached(code):
+    assert ResultCache().key(code, "/w", "v1") is None
+
+
+def test_deterministic_code_is_cached_until_it_expires():
+    cache = ResultCache(ttl_seconds=3600)
+    key = cache.key("print(load_table('items')['quantity'].sum())", "/w", "v1")
+    assert key == cache.key("print(load_table('items')['quantity'].sum())  # total", "/w", "v1")
+    cache.put(key, "42\n")
+    assert cache.get(key) == "42\n"
+
+    cache.ttl_seconds = 0
+    assert cache.get(key) is None
+
+
+@pytest.mark.parametrize(
+    "sql, volatile",
+    [
+        ("SELECT sum(total) FROM invoices", False),
+        ("SELECT * FROM invoices WHERE due_date < current_date", True),
+        ("SELECT * FROM invoices WHERE due_date < NOW()", True),
+        ("SELECT * FROM items ORDER BY random() LIMIT 3", True),
+    ],
+)
+def test_sql_reading_the_clock_or_randomness_is_volatile(sql, volatile):
+    assert is_volatile_sql(sql) is volatile
@@ -0,0 +1,74 @@
+import pytest
+
+import sandbox
+
+
+@pytest.fixture
+def pool():
+    # A single worker, so consecutive runs go through the same warm process
+    pool = sandbox.SandboxPool(size=1)
+    yield pool
+    pool.close()
+
+
+def test_globals_do_not_leak_between_runs(pool, tmp_path):
+    first = tmp_path / "u1"
+    second = tmp_path / "u2"
+    first.mkdir()
+    second.mkdir()
+    result = pool.run("import builtins\nbuiltins.stash = 'u1 rows'\nleaked = True", str(first))
+    assert result.returncode == 0
+
+    result = pool.run(
+        "import builtins\nprint(hasattr(builtins, 'stash'), 'leaked' in globals())", str(second)
+    )
+    assert result.returncode == 0
+    assert result.stdout == "False False\n"
+
+
+def test_module_state_does_not_leak_between_runs(pool):
+    pool.run("import pandas as pd\npd.set_option('display.max_rows', 3)")
+    result = pool.run("import pandas as pd\nprint(pd.get_option('display.max_rows'))")
+    assert result.stdout == "60\n"
+
+
+def test_output_of_child_processes_is_captured(pool):
+    result = pool.run("import os\nprint('before', flush=True)\nos.system('echo from_shell')")
+    assert result.returncode == 0
+    assert result.stdout == "before\nfrom_shell\n"
+
+
+def test_os_exit_keeps_output_and_status(pool):
+    result = pool.run("import os\nprint('printed')\nos._exit(0)")
+    assert (result.returncode, result.stdout) == (0, "printed\n")
+
+    result = pool.run("import sys\nsys.exit(3)")
+    assert result.returncode == 3
+
+
+def test_errors_match_python_c(pool):
+    result = pool.run("1 / 0")
+    assert result.returncode == 1
+    assert result.stderr.startswith("Traceback (most recent call last):\n  File \"<string>\", line 1")
+    assert result.stderr.endswith("ZeroDivisionError: division by zero\n")
+
+
+def test_output_limit(pool):
+    result = pool.run(f"print('a' * {sandbox.SANDBOX_MAX_OUTPUT_CHARS * 2})")
+    assert result.limit == "output"
+    assert len(result.stdout) == sandbox.SANDBOX_MAX_OUTPUT_CHARS
+
+
+def test_worker_that_fails_to_start_returns_an_error(monkeypatch):
+    def broken_worker():
+        raise RuntimeError("preload import failed")
+
+    monkeypatch.setattr(sandbox, "SandboxWorker", broken_worker)
+    monkeypatch.setattr(sandbox, "SANDBOX_ACQUIRE_TIMEOUT_SECONDS", 0.5)
+    pool = sandbox.SandboxPool(size=1)
+    try:
+        result = pool.run("print(1)")
+    finally:
+        pool.close()
+    assert result.returncode == 1
+    assert "preload import failed" in result.stderr
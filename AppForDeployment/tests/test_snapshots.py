@@ -0,0 +1,27 @@
+import os
+import time
+
+from snapshots import create_snapshot, prune_snapshots
+
+
+def _snapshot(snapshots_dir, age_seconds):
+    snapshot = os.path.dirname(create_snapshot(str(snapshots_dir)))
+    published_at = time.time() - age_seconds
+    os.utime(snapshot, (published_at, published_at))
+    return snapshot
+
+
+def test_replaced_snapshots_are_kept_for_the_grace_period(tmp_path):
+    oldest = _snapshot(tmp_path, 7200)
+    replaced_long_ago = _snapshot(tmp_path, 5400)
+    replaced_recently = _snapshot(tmp_path, 3000)
+    previous = _snapshot(tmp_path, 60)
+    current = _snapshot(tmp_path, 0)
+
+    prune_snapshots(str(tmp_path), keep=2, in_use=[current], grace_seconds=3600)
+
+    assert not os.path.exists(oldest)
+    # Replaced by `replaced_recently` 50 minutes ago: in-flight requests may still read it
+    assert os.path.exists(replaced_long_ago)
+    assert os.path.exists(replaced_recently)
+    assert os.path.exists(previous) and os.path.exists(current)
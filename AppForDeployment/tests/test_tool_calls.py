@@ -0,0 +1,18 @@
+from functions import QueryAnalysisOutput, parse_tool_call, tool_arguments
+
+
+def test_valid_tool_call():
+    tool, error = parse_tool_call("QueryAnalysisOutput", '{"table_name": "items"}')
+    assert error is None
+    assert isinstance(tool, QueryAnalysisOutput)
+
+
+def test_unknown_tool_gives_an_error_result():
+    assert parse_tool_call("DeleteEverything", "{}") == (None, "Unknown tool 'DeleteEverything'")
+
+
+def test_malformed_arguments_give_an_error_result():
+    tool, error = parse_tool_call("SQLAnalysis", '{"sql": "SELECT 1"')
+    assert tool is None
+    assert error.startswith("Invalid arguments for SQLAnalysis")
+    assert tool_arguments('{"sql": "SELECT 1"') == {"arguments": '{"sql": "SELECT 1"'}
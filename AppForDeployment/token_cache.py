@@ -0,0 +1,66 @@
+"""
+Process-wide cache of gateway user tokens.
+
+Tokens are requested with ``duration=72h``; they are reused until shortly
+before that expiry and refreshed ahead of time. Concurrent callers for the
+same user share a single in-flight fetch.
+"""
+
+import os
+import threading
+import time
+
+# Matches the `duration=72h` requested from the auth endpoint.
+TOKEN_TTL_SECONDS = 72 * 60 * 60
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "3600"))
+
+
+class TokenCache:
+    def __init__(
+        self,
+        ttl_seconds: float = TOKEN_TTL_SECONDS,
+        refresh_margin_seconds: float = TOKEN_REFRESH_MARGIN_SECONDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._tokens = {}  # user_id -> (token, expires_at)
+        self._lock = threading.Lock()
+        self._user_locks = {}
+
+    def _valid(self, user_id: str):
+        cached = self._tokens.get(user_id)
+        if cached and time.monotonic() < cached[1] - self.refresh_margin_seconds:
+            return cached[0]
+        return None
+
+    def get(self, user_id: str, fetch_token) -> str:
+        """Return a cached token for `user_id`, calling `fetch_token(user_id)` if needed."""
+        with self._lock:
+            token = self._valid(user_id)
+            if token is not None:
+                return token
+            user_lock = self._user_locks.setdefault(user_id, threading.Lock())
+
+        with user_lock:
+            with self._lock:
+                token = self._valid(user_id)
+            if token is not None:
+                return token
+            fetched_at = time.monotonic()
+            token = fetch_token(user_id)
+            with self._lock:
+                self._tokens[user_id] = (token, fetched_at + self.ttl_seconds)
+            return token
+
+    def invalidate(self, user_id: str, token: str = None):
+        """
+        Forget the token of `user_id`. When `token` is given, only forget it if
+        it is still the cached one, so concurrent 401s trigger a single refresh.
+        """
+        with self._lock:
+            cached = self._tokens.get(user_id)
+            if cached and (token is None or cached[0] == token):
+                del self._tokens[user_id]
+
+
+TOKEN_CACHE = TokenCache()
@@ -0,0 +1,83 @@
+"""
+Denormalized views materialized next to the synced tables.
+
+Each view starts from a base table and left-joins dimension tables on
+their primary key, one after the other, so a join can use columns brought
+in by an earlier one (e.g. the client of an invoice line's invoice). The
+foreign key is the first of the candidate columns found in the frame, as
+the gateway payloads don't all name their references the same way; a join
+whose key can't be found is skipped.
+"""
+
+import pandas as pd
+
+VIEWS = {
+    "invoice_lines_enriched": {
+        "base": "invoice_lines",
+        "joins": [
+            ("invoices", "invoice", ["invoice_id"]),
+            ("clients", "client", ["invoice_client", "invoice_client__id", "invoice_client_id", "invoice_clientId"]),
+            ("items", "item", ["item", "item__id", "item_id", "itemId", "product", "product__id", "product_id"]),
+        ],
+    },
+    "purchase_lines_enriched": {
+        "base": "purchase_lines",
+        "joins": [
+            ("purchases", "purchase", ["purchase_id"]),
+            ("suppliers", "supplier", ["purchase_supplier", "purchase_supplier__id", "purchase_supplier_id", "purchase_supplierId"]),
+            ("items", "item", ["item", "item__id", "item_id", "itemId", "product", "product__id", "product_id"]),
+        ],
+    },
+    "invoices_enriched": {
+        "base": "invoices",
+        "joins": [("clients", "client", ["client", "client__id", "client_id", "clientId"])],
+    },
+    "purchases_enriched": {
+        "base": "purchases",
+        "joins": [("suppliers", "supplier", ["supplier", "supplier__id", "supplier_id", "supplierId"])],
+    },
+}
+VIEW_KEY = "_id"
+
+
+def view_sources(view_name: str) -> list:
+    view = VIEWS[view_name]
+    return [view["base"]] + [table for table, _, _ in view["joins"]]
+
+
+def key_index(df: pd.DataFrame, key: str = VIEW_KEY) -> pd.DataFrame:
+    """`df` indexed by its primary key, keeping the last row of duplicated keys."""
+    return df.drop_duplicates(key, keep="last").set_index(key)
+
+
+def build_view(view_name: str, tables: dict):
+    """Build one view from `tables` (name -> DataFrame); None if nothing to join."""
+    view = VIEWS[view_name]
+    if view["base"] not in tables:
+        return None
+    df = tables[view["base"]]
+    joined_any = False
+    for table, prefix, candidates in view["joins"]:
+        dimension = tables.get(table)
+        foreign_key = next((column for column in candidates if column in df.columns), None)
+        if dimension is None or foreign_key is None or VIEW_KEY not in dimension.columns:
+            continue
+        index = key_index(dimension)
+        index.columns = [f"{prefix}_{column}" for column in index.columns]
+        # Unknown keys give rows of NaN, as with a left join
+        joined = index.reindex(df[foreign_key].to_numpy()).reset_index(drop=True)
+        joined = joined.drop(columns=[c for c in joined.columns if c in df.columns])
+        df = pd.concat([df.reset_index(drop=True), joined], axis=1)
+        joined_any = True
+    # A view without any join would only duplicate its base table
+    return df if joined_any else None
+
+
+def format_views(data: dict) -> str:
+    """Describe the materialized views of `data` for the system prompt."""
+    views = [name for name in VIEWS if name in data]
+    if not views:
+        return "None"
+    return "\n\n".join(
+        f"{name} (= {' + '.join(view_sources(name))}) :\n{data[name][1]}" for name in views
+    )
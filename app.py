@@ -1,13 +1,19 @@
-import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
 from openai import OpenAI
-from data_fetching import update_data, get_data
+from data_fetching import DATA_DIR, update_data, get_data, has_data, format_child_tables, memory_report
 from auth import login
 from configs import SYSTEM_PROMPT, TABLES_DEFINITIONS
-from functions import InventoryCodeInterpreter
+from views import format_views
+from rollups import format_rollups
+from functions import TOOL_CLASSES, SQLAnalysis, parse_tool_call, tool_arguments
+from metrics import STAGE_SECONDS, record_llm_usage, usage_to_dict
+from context_budget import compact_messages, tool_result_content
+from refresh import RefreshScheduler
 
 load_dotenv()
 # login()
@@ -15,9 +21,24 @@ st.set_page_config(
     page_title="SupplyZPro LLM", layout="wide", initial_sidebar_state="expanded"
 )
 
+
+@st.cache_resource
+def get_refresher() -> RefreshScheduler:
+    """One scheduler per server: it re-syncs the tables in the background."""
+    refresher = RefreshScheduler(lambda _: update_data())
+    if has_data():
+        refresher.touch(DATA_DIR, last_refresh=os.path.getmtime(DATA_DIR))
+    refresher.start()
+    return refresher
+
+
 if "data_updated" not in st.session_state:
-    with st.spinner("Updating Data from Server"):
-        update_data()
+    refresher = get_refresher()
+    # Serve the last snapshot; sessions started after a refresh get the new one
+    if not has_data():
+        with st.spinner("Updating Data from Server"):
+            refresher.submit(DATA_DIR).result()
+    with st.spinner("Loading Data"):
         data = get_data()
 
         st.session_state["invoices_sig"] = data["invoices"][1]
@@ -32,23 +53,53 @@ if "data_updated" not in st.session_state:
                 suppleirs_mapping=data["suppliers"][1],
                 purrchases_mapping=data["purchases"][1],
                 invoices_mapping=data["invoices"][1],
+                child_tables_mapping=format_child_tables(data),
+                views_mapping=format_views(data),
+                rollups_mapping=format_rollups(data),
             )
         )
 
         st.session_state.data_updated = True
 
 
+# Every interaction keeps the tables refreshed in the background
+get_refresher().touch(DATA_DIR)
+
+
 # Config
 OPENAI_MODEL = "gpt-4o"
 INSTRUCTIONS = st.session_state["SYSTEM_PROMPT"]
-PRICE_PER_TOKEN = 2.5e-6
-TOKEN_LENGTH_RATIO = 1.3
 MAX_FUNCTION_CALL_ITERATIONS = 10
+# Tool calls of one model turn run concurrently, at most this many at once
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", "4"))
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": tool.__doc__,
+            "parameters": tool.schema(),
+        },
+    }
+    for name, tool in TOOL_CLASSES.items()
+]
+
+
+def run_tool_call(tool_call: dict) -> str:
+    """Run one tool call; an unknown tool or invalid arguments give an error result."""
+    tool, error = parse_tool_call(tool_call["function"]["name"], tool_call["function"]["arguments"])
+    return error if tool is None else tool.run()
 
 
 # State management
-if "len_tokens" not in st.session_state:
-    st.session_state["len_tokens"] = len(INSTRUCTIONS.split()) * TOKEN_LENGTH_RATIO
+# Token usage reported by OpenAI, summed over every completion of the session
+if "usage" not in st.session_state:
+    st.session_state["usage"] = {
+        "prompt_tokens": 0,
+        "cached_prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cost_usd": 0.0,
+    }
 
 if "messages_generation" not in st.session_state:
     st.session_state["messages_generation"] = []
@@ -148,14 +199,48 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 token_placeholder = st.sidebar.empty()
 cost_placeholder = st.sidebar.empty()
+latency_placeholder = st.sidebar.empty()
+
+with st.sidebar.expander("Table memory"):
+    report = memory_report()
+    for table_name, usage in report.items():
+        st.markdown(
+            f"**{table_name}:** {usage['after_bytes'] / 2**20:,.1f} MB "
+            f"(saved {usage['saved_bytes'] / 2**20:,.1f} MB)"
+        )
 
-token_placeholder.markdown(f"**Tokens length:** {st.session_state['len_tokens']:,.0f}")
-cost_placeholder.markdown(
-    f"**Cost Estimation:** {round(st.session_state['len_tokens'] * PRICE_PER_TOKEN,5) } USD"
-)
+
+def show_usage():
+    usage = st.session_state["usage"]
+    token_placeholder.markdown(
+        f"**Prompt tokens:** {usage['prompt_tokens']:,} "
+        f"({usage['cached_prompt_tokens']:,} cached)  \n"
+        f"**Completion tokens:** {usage['completion_tokens']:,}"
+    )
+    cost_placeholder.markdown(f"**Cost:** {usage['cost_usd']:.5f} USD")
+    stages = STAGE_SECONDS.summary()
+    latency_placeholder.markdown(
+        "**Stage latency:**  \n"
+        + "  \n".join(
+            f"{dict(labels)['stage']}: {total / count:.3f}s avg over {count}"
+            for labels, (count, total) in sorted(stages.items())
+        )
+        if stages
+        else ""
+    )
+
+
+def add_usage(usage):
+    iteration_usage = usage_to_dict(usage)
+    iteration_usage["cost_usd"] = record_llm_usage(iteration_usage)
+    for key, value in iteration_usage.items():
+        st.session_state["usage"][key] += value
+
+
+show_usage()
 
 for message in st.session_state["messages_generation"]:  # [1:]:
-    if message["role"] != "tool":
+    if message["role"] != "tool" and message["content"]:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
@@ -169,75 +254,91 @@ if prompt := st.chat_input("Type your message:"):
     iteration = 0
     while iteration < MAX_FUNCTION_CALL_ITERATIONS:
         system_message = {"role": "system", "content": INSTRUCTIONS}
-        response = client.chat.completions.create(
+        llm_started = time.perf_counter()
+        stream = client.chat.completions.create(
             model=OPENAI_MODEL,
-            messages=[system_message] + st.session_state["messages_generation"],
-            tools=[
-                {
-                    "type": "function",
-                    "function": {
-                        "name": InventoryCodeInterpreter.__class__.__name__,
-                        "description": InventoryCodeInterpreter.__class__.__doc__,
-                        "parameters": InventoryCodeInterpreter.schema(),
-                    },
-                }
-            ],
-            stream=False,
+            # The full history stays in the session; only a budgeted view is sent
+            messages=[system_message] + compact_messages(st.session_state["messages_generation"]),
+            tools=TOOLS,
+            stream=True,
+            stream_options={"include_usage": True},
             temperature=0,
-            # NOTE: this app doesn't currently support parallel tool calls
-            parallel_tool_calls=False,
         )
 
+        # Render the assistant text as it streams in; tool calls arrive in
+        # fragments keyed by their index and are assembled on the way.
+        message_content = ""
+        message_placeholder = None
+        tool_calls = {}
+        usage = None
+        for chunk in stream:
+            # The last chunk carries the usage of the whole completion
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                if message_placeholder is None:
+                    message_placeholder = st.chat_message("assistant").empty()
+                message_content += delta.content
+                message_placeholder.markdown(message_content + "▌")
+            for tc in delta.tool_calls or []:
+                call = tool_calls.setdefault(
+                    tc.index,
+                    {"id": None, "type": "function", "function": {"name": "", "arguments": ""}},
+                )
+                if tc.id:
+                    call["id"] = tc.id
+                if tc.function and tc.function.name:
+                    call["function"]["name"] += tc.function.name
+                if tc.function and tc.function.arguments:
+                    call["function"]["arguments"] += tc.function.arguments
+        if message_placeholder is not None:
+            message_placeholder.markdown(message_content)
+        STAGE_SECONDS.observe(time.perf_counter() - llm_started, stage="llm")
+
         # Add the model response to the list of messages
-        assistant_message = {
-            "role": "assistant",
-            "content": response.choices[0].message.content,
-            "tool_calls": response.choices[0].message.tool_calls,
-        }
+        assistant_message = {"role": "assistant", "content": message_content or None}
+        if tool_calls:
+            assistant_message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
         st.session_state["messages_generation"].append(assistant_message)
 
-        # Handle empty contents (e.g., when the model doesn't generate any text for tool calls)
-        message_content = assistant_message["content"] or ""
-        if message_content:
-            with st.chat_message("assistant"):
-                st.markdown(assistant_message["content"])
+        # Update consumed tokens and cost from the usage reported by OpenAI
+        add_usage(usage)
+        show_usage()
 
-        # Update consumed tokens and cost
-        # NOTE: This underestimates the cost as it doesn't account for the tool calls
-        st.session_state["len_tokens"] += (
-            len(message_content.split()) * TOKEN_LENGTH_RATIO
-        )
-        token_placeholder.markdown(f"Tokens length: {st.session_state['len_tokens']}")
-        cost_placeholder.markdown(
-            f"Cost Estimation: {round(st.session_state['len_tokens'] * PRICE_PER_TOKEN,5)} USD"
-        )
+        # Handle tool calls: the calls of one turn run concurrently
+        if tool_calls:
+            calls = assistant_message["tool_calls"]
+            with st.status("Calling SupplyZPro Analysis tool ...") as tool_status:
+                for tool_call in calls:
+                    arguments = tool_arguments(tool_call["function"]["arguments"])
+                    if tool_call["function"]["name"] == SQLAnalysis.__name__:
+                        st.code(arguments.get("sql"), language="sql")
+                    elif "python_code" in arguments:
+                        st.code(arguments["python_code"], language="python")
+                    else:
+                        st.json(arguments)
+                # One executor per turn: the cap applies to this session only
+                with ThreadPoolExecutor(
+                    max_workers=TOOL_CALL_CONCURRENCY, thread_name_prefix="tool"
+                ) as executor:
+                    tool_results = list(executor.map(run_tool_call, calls))
+                tool_status.update(
+                    label="SupplyZPro Analysis tool finished", state="complete"
+                )
 
-        # Handle tool calls
-        if assistant_message["tool_calls"]:
-            tool_call = response.choices[0].message.tool_calls[0]
-            tc_args = tool_call.function.arguments
-            tc_id = tool_call.id
-
-            # with st.chat_message("assistant"):
-            # st.json(tool_call)
-
-            python_code_arg = json.loads(tc_args).get("python_code")
-            with st.spinner("Calling SupplyZPro Analysis tool ..."):
-                # NOTE: .parse_raw is deprecated in newer versions of Pydantic
-                tool_result = InventoryCodeInterpreter.parse_raw(tc_args).run()
-
-            # Add the tool result to the list of messages
-            tool_result_message = {
-                "role": "tool",
-                "content": json.dumps(
-                    {
-                        "python_code": python_code_arg,
-                        "result": tool_result,
-                    }
-                ),
-                "tool_call_id": tc_id,
-            }
-            st.session_state["messages_generation"].append(tool_result_message)
+            # Add the tool results to the list of messages, in call order
+            for tool_call, tool_result in zip(calls, tool_results):
+                tool_result_message = {
+                    "role": "tool",
+                    "content": tool_result_content(
+                        tool_arguments(tool_call["function"]["arguments"]), tool_result
+                    ),
+                    "tool_call_id": tool_call["id"],
+                }
+                st.session_state["messages_generation"].append(tool_result_message)
         else:
             break
         iteration += 1
@@ -1,24 +1,77 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from token_cache import TOKEN_CACHE
+from result_cache import RESULT_CACHE
+from metrics import STAGE_SECONDS
+from schema import compact_schema
+from dtype_optimizer import optimize_with_report
+from flattening import normalize_records
+from views import VIEWS, build_view
+from rollups import ROLLUPS, build_rollup
+from snapshots import create_snapshot, prune_snapshots, publish_snapshot
 import streamlit as st
 
+GATEWAY_URL = os.getenv("GATEWAY_URL", "https://gateway-dev.supplyz.tech").rstrip("/")
 TABLE_URLS = {
-    "clients": "https://gateway-dev.supplyz.tech/orders_service/ai/v1/clients",
-    "invoices": "https://gateway-dev.supplyz.tech/orders_service/ai/v1/invoices",
-    "items": "https://gateway-dev.supplyz.tech/inventory/ai/v1/items",
-    "purchases": "https://gateway-dev.supplyz.tech/inventory/ai/v1/purchases",
-    "suppliers": "https://gateway-dev.supplyz.tech/inventory/ai/v1/suppliers",
+    "clients": f"{GATEWAY_URL}/orders_service/ai/v1/clients",
+    "invoices": f"{GATEWAY_URL}/orders_service/ai/v1/invoices",
+    "items": f"{GATEWAY_URL}/inventory/ai/v1/items",
+    "purchases": f"{GATEWAY_URL}/inventory/ai/v1/purchases",
+    "suppliers": f"{GATEWAY_URL}/inventory/ai/v1/suppliers",
 }
+TABLE_NAMES = ("items", "clients", "purchases", "invoices", "suppliers")
+USER_ID = "670175884b923eac46d240f3"
+# Base and child table names of the last sync, in prompt order.
+TABLES_MANIFEST = "_tables.json"
+# Memory use of each table before and after dtype optimization.
+MEMORY_REPORT_FILE = "_memory_report.json"
+# Each sync writes snapshots/<id>/data and then points the data symlink to it.
+DATA_DIR = "data"
+SNAPSHOTS_DIR = "snapshots"
 
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "5"))
 
-def get_user_token(user_id: str) -> str:
-    url = f"https://gateway-dev.supplyz.tech/user_management_service/ai/v1/auth?user_id={user_id}&duration=72h"
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """Return the shared keep-alive session for the gateway host of `url`."""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=FETCH_CONCURRENCY)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def _request_user_token(user_id: str) -> str:
+    url = f"{GATEWAY_URL}/user_management_service/ai/v1/auth?user_id={user_id}&duration=72h"
     headers = {"ai-key": "randomAIKey"}
-    resp = requests.get(url, headers=headers)
+    resp = get_session(url).get(url, headers=headers)
     resp.raise_for_status()
     return resp.json()["token"]
 
 
+def get_user_token(user_id: str) -> str:
+    return TOKEN_CACHE.get(user_id, _request_user_token)
+
+
 def flatten_json(y, sep="_"):
     """
     Recursively flattens a nested JSON/dictionary.
@@ -48,67 +101,236 @@ def flatten_json(y, sep="_"):
     return out
 
 
-def fetch_data(table_name: str) -> pd.DataFrame:
-    token = get_user_token("670175884b923eac46d240f3")
+def fetch_data(table_name: str, token: str = None) -> dict:
+    """
+    Fetch one table and return it together with the child tables built from
+    its nested record lists, as ``{table name: DataFrame}``.
+    """
+    token = token or get_user_token(USER_ID)
     try:
         url = TABLE_URLS[table_name]
     except KeyError:
         raise ValueError(f"Unknown table: {table_name}")
     headers = {"ai-key": "randomAIKey", "user-token": token}
-    resp = requests.get(url, headers=headers)
+    with STAGE_SECONDS.time(stage="gateway_fetch"):
+        resp = get_session(url).get(url, headers=headers)
+        if resp.status_code == 401:
+            # The gateway rejected the token: drop it and retry once with a fresh one.
+            TOKEN_CACHE.invalidate(USER_ID, token)
+            headers["user-token"] = get_user_token(USER_ID)
+            resp = get_session(url).get(url, headers=headers)
     resp.raise_for_status()
     json_data = resp.json()
 
-    flat_records = [flatten_json(record) for record in json_data["data"]]
-    df = pd.DataFrame(flat_records)
-    return df.dropna(axis=1, how="all")
+    with STAGE_SECONDS.time(stage="flatten"):
+        tables = normalize_records(table_name, json_data["data"])
+    return {name: df.dropna(axis=1, how="all") for name, df in tables.items()}
+
+
+def fetch_all_tables(concurrency: int = FETCH_CONCURRENCY) -> dict:
+    """
+    Fetch every table concurrently with a single user token, so a cold sync
+    takes about as long as the slowest endpoint.
+    """
+    token = get_user_token(USER_ID)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            table_name: executor.submit(fetch_data, table_name, token)
+            for table_name in TABLE_NAMES
+        }
+        tables = {}
+        for future in futures.values():
+            tables.update(future.result())
+        return tables
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Stringify object columns with mixed JSON values that Arrow cannot type."""
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].map(lambda v: v if v is None else str(v))
+    return df
+
+
+def write_arrow_snapshot(df: pd.DataFrame, path: str):
+    """
+    Write a table as an uncompressed Arrow IPC file that the sandbox can
+    memory-map. The file is swapped in atomically so workers that already
+    mapped the previous version keep a valid view.
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        table = pa.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _write_snapshot(data_dir: str):
+    """Fetch every table into the snapshot `data_dir`."""
+    tables = fetch_all_tables()
+    memory = {}
+    for table_name in tables:
+        tables[table_name], memory[table_name] = optimize_with_report(tables[table_name])
+    for view_name in VIEWS:
+        view = build_view(view_name, tables)
+        if view is not None:
+            tables[view_name] = view
+    for rollup_name in ROLLUPS:
+        rollup = build_rollup(rollup_name, tables)
+        if rollup is not None:
+            tables[rollup_name] = rollup
+    for table_name, df in tables.items():
+        with STAGE_SECONDS.time(stage="table_io"):
+            df.to_csv(os.path.join(data_dir, f"{table_name}.csv"))
+            write_arrow_snapshot(df, os.path.join(data_dir, f"{table_name}.arrow"))
+    with open(os.path.join(data_dir, TABLES_MANIFEST), "w") as f:
+        json.dump(list(tables), f)
+    with open(os.path.join(data_dir, MEMORY_REPORT_FILE), "w") as f:
+        json.dump(memory, f)
 
 
 def update_data():
-    fetch_data("items").to_csv(
-        "data/items.csv"
-    )
-    fetch_data("clients").to_csv(
-        "data/clients.csv"
-    )
-    fetch_data("purchases").to_csv(
-        "data/purchases.csv"
-    )
-    fetch_data("invoices").to_csv(
-        "data/invoices.csv"
-    )
-    fetch_data("suppliers").to_csv(
-        "data/suppliers.csv"
+    """
+    Fetch every table into a new snapshot and publish it by swapping the
+    data symlink, so readers never see a half-written table.
+    """
+    data_dir = create_snapshot(SNAPSHOTS_DIR)
+    try:
+        _write_snapshot(data_dir)
+    except BaseException:
+        shutil.rmtree(os.path.dirname(data_dir), ignore_errors=True)
+        raise
+    publish_snapshot(DATA_DIR, data_dir, SNAPSHOTS_DIR)
+    prune_snapshots(SNAPSHOTS_DIR, in_use=[data_dir])
+    # Results computed against the previous tables are no longer valid
+    RESULT_CACHE.invalidate(os.getcwd())
+
+
+def has_data(data_dir: str = DATA_DIR) -> bool:
+    """
+    Whether a sync left Arrow tables to serve. A ./data written before the
+    Arrow snapshots holds only csv files, which nothing reads: it is synced again.
+    """
+    return os.path.isdir(data_dir) and all(
+        os.path.isfile(os.path.join(data_dir, f"{table_name}.arrow"))
+        for table_name in _load_manifest(data_dir)
     )
 
 
 st.cache_data
 
 
+def _load_manifest(data_dir: str = "data") -> list:
+    try:
+        with open(os.path.join(data_dir, TABLES_MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return list(TABLE_NAMES)
+
+
+def read_table(table_name: str, data_dir: str = "data") -> pd.DataFrame:
+    with STAGE_SECONDS.time(stage="table_io"):
+        # The Arrow snapshot keeps the optimized dtypes, the csv doesn't
+        with pa.memory_map(os.path.join(data_dir, f"{table_name}.arrow")) as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+
+
 def get_data():
-    items = pd.read_csv("data/items.csv")
-    clients = pd.read_csv(
-        "data/clients.csv"
-    )
-    purchases = pd.read_csv(
-        "data/purchases.csv"
-    )
-    invoices = pd.read_csv(
-        "data/invoices.csv"
-    )
-    suppliers = pd.read_csv(
-        "data/suppliers.csv"
-    )
-    items_sig = items.dtypes.to_dict()
-    clients_sig = clients.dtypes.to_dict()
-    purchases_sig = purchases.dtypes.to_dict()
-    invoices_sig = invoices.dtypes.to_dict()
-    suppliers_sig = suppliers.dtypes.to_dict()
+    data = {}
+    for table_name in _load_manifest():
+        df = read_table(table_name)
+        data[table_name] = [df, compact_schema(df)]
+    return data
 
+
+def table_names(data_dir: str = "data") -> list:
+    """Names of the tables stored in `data_dir`, in prompt order."""
+    return _load_manifest(data_dir)
+
+
+def open_dataset(table_name: str, data_dir: str = "data") -> ds.Dataset:
+    """
+    The Arrow snapshot of a table as a memory-mapped pyarrow dataset: scans
+    only touch the columns a query needs.
+    """
+    return ds.dataset(os.path.join(data_dir, f"{table_name}.arrow"), format="arrow")
+
+
+class LazyTables(Mapping):
+    """
+    Read-only ``{table name: DataFrame}`` view of the tables in `data_dir`.
+    Each table is read on first access and then kept in memory until
+    `data_dir` points to another snapshot.
+    """
+
+    def __init__(self, data_dir: str = "data"):
+        self.data_dir = data_dir
+        self._frames = {}
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def __getitem__(self, table_name: str) -> pd.DataFrame:
+        with self._lock:
+            snapshot = os.path.realpath(self.data_dir)
+            if snapshot != self._snapshot:
+                self._frames, self._snapshot = {}, snapshot
+            if table_name not in self._frames:
+                if table_name not in _load_manifest(self.data_dir):
+                    raise KeyError(table_name)
+                self._frames[table_name] = read_table(table_name, self.data_dir)
+            return self._frames[table_name]
+
+    def __iter__(self):
+        return iter(_load_manifest(self.data_dir))
+
+    def __len__(self) -> int:
+        return len(_load_manifest(self.data_dir))
+
+
+def memory_report() -> dict:
+    """Memory of each table before and after dtype optimization, with the bytes saved."""
+    try:
+        with open(f"data/{MEMORY_REPORT_FILE}") as f:
+            report = json.load(f)
+    except FileNotFoundError:
+        return {}
     return {
-        "items": [items, items_sig],
-        "clients": [clients, clients_sig],
-        "purchases": [purchases, purchases_sig],
-        "invoices": [invoices, invoices_sig],
-        "suppliers": [suppliers, suppliers_sig],
+        name: {**usage, "saved_bytes": usage["before_bytes"] - usage["after_bytes"]}
+        for name, usage in report.items()
     }
+
+
+def data_version(data_dir: str = "data") -> str:
+    """
+    Fingerprint of the tables stored in `data_dir`. It changes whenever a
+    sync rewrites one of them and stays the same when nothing changed.
+    """
+    try:
+        entries = list(os.scandir(data_dir))
+    except FileNotFoundError:
+        return ""
+    stats = sorted(
+        (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+        for entry in entries
+        if entry.is_file()
+        and not entry.name.startswith("_")
+        and not entry.name.endswith(".tmp")
+    )
+    return hashlib.sha1(repr(stats).encode()).hexdigest()
+
+
+def format_child_tables(data: dict) -> str:
+    """Describe the child tables of `data` for the system prompt."""
+    children = [
+        name for name in data if name not in TABLE_NAMES and name not in VIEWS and name not in ROLLUPS
+    ]
+    if not children:
+        return "None"
+    return "\n\n".join(f"{name} :\n{data[name][1]}" for name in children)
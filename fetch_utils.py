@@ -1,8 +1,9 @@
 import requests
 import pandas as pd
+from token_cache import TOKEN_CACHE
 
 
-def get_user_token(user_id: str) -> str:
+def _request_user_token(user_id: str) -> str:
     url = f"https://gateway-dev.supplyz.tech/user_management_service/ai/v1/auth?user_id={user_id}&duration=72h"
     headers = {"ai-key": "randomAIKey"}
     resp = requests.get(url, headers=headers)
@@ -10,7 +11,11 @@ def get_user_token(user_id: str) -> str:
     return resp.json()["token"]
 
 
-def fetch_data(table_name: str, token: str) -> pd.DataFrame:
+def get_user_token(user_id: str) -> str:
+    return TOKEN_CACHE.get(user_id, _request_user_token)
+
+
+def fetch_data(table_name: str, token: str, user_id: str = None) -> pd.DataFrame:
     if table_name == "clients":
         url = "https://gateway-dev.supplyz.tech/orders_service/ai/v1/clients"
     elif table_name == "invoices":
@@ -26,6 +31,11 @@ def fetch_data(table_name: str, token: str) -> pd.DataFrame:
 
     headers = {"ai-key": "randomAIKey", "user-token": token}
     resp = requests.get(url, headers=headers)
+    if resp.status_code == 401 and user_id:
+        # The gateway rejected the token: drop it and retry once with a fresh one.
+        TOKEN_CACHE.invalidate(user_id, token)
+        headers["user-token"] = get_user_token(user_id)
+        resp = requests.get(url, headers=headers)
     resp.raise_for_status()
     json_data = resp.json()
 
@@ -0,0 +1,142 @@
+"""
+Background refresh of the synced tables.
+
+Every tenant with a request in the last REFRESH_IDLE_SECONDS is re-synced
+every REFRESH_INTERVAL_SECONDS by a small pool of worker threads, and can be
+refreshed on demand. Idle tenants are dropped from the schedule until their
+next request, so tenants that stopped using the service cost no gateway or
+disk load. Requests never wait for a refresh: they keep being served from the
+last published snapshot until the refresh publishes a new one. Only a tenant
+that has never been synced has to wait for its first sync.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import REFRESHES, STAGE_SECONDS
+
+REFRESH_INTERVAL_SECONDS = float(os.getenv("REFRESH_INTERVAL_SECONDS", "900"))
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", "2"))
+# Tenants without a request for this long are no longer refreshed; 0 keeps them
+REFRESH_IDLE_SECONDS = float(os.getenv("REFRESH_IDLE_SECONDS", "3600"))
+
+
+class RefreshScheduler:
+    """
+    Runs `refresh(tenant)` in the background, at most once at a time per
+    tenant. `submit` returns the Future of the refresh already in flight for
+    the tenant, if any.
+    """
+
+    def __init__(
+        self,
+        refresh,
+        interval_seconds: float = REFRESH_INTERVAL_SECONDS,
+        concurrency: int = REFRESH_CONCURRENCY,
+        idle_seconds: float = REFRESH_IDLE_SECONDS,
+    ):
+        self.refresh = refresh
+        self.interval_seconds = interval_seconds
+        self.idle_seconds = idle_seconds
+        self._executor = ThreadPoolExecutor(max(1, concurrency), thread_name_prefix="refresh")
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        # tenant -> {"last_refresh": wall time or None, "last_error": str or None,
+        #            "last_seen": wall time of its last request}
+        self._tenants = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def touch(self, tenant: str, last_refresh: float = None):
+        """
+        Record a request of `tenant`, adding it to the schedule if needed;
+        `last_refresh` is when its data was last synced.
+        """
+        with self._lock:
+            status = self._tenants.setdefault(
+                tenant, {"last_refresh": last_refresh, "last_error": None}
+            )
+            status["last_seen"] = time.time()
+
+    def submit(self, tenant: str):
+        self.touch(tenant)
+        with self._lock:
+            future = self._in_flight.get(tenant)
+            if future is None:
+                future = self._executor.submit(self._run, tenant)
+                self._in_flight[tenant] = future
+            return future
+
+    def _run(self, tenant: str):
+        started = time.perf_counter()
+        try:
+            result = self.refresh(tenant)
+        except Exception as e:
+            REFRESHES.inc(outcome="error")
+            with self._lock:
+                self._tenants[tenant]["last_error"] = str(e)
+            raise
+        else:
+            REFRESHES.inc(outcome="ok")
+            with self._lock:
+                self._tenants[tenant].update(last_refresh=time.time(), last_error=None)
+            return result
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="refresh")
+            with self._lock:
+                self._in_flight.pop(tenant, None)
+
+    def drop_idle(self) -> list:
+        """Stop refreshing the tenants without a request for `idle_seconds`."""
+        if not self.idle_seconds:
+            return []
+        cutoff = time.time() - self.idle_seconds
+        with self._lock:
+            idle = [
+                tenant
+                for tenant, status in self._tenants.items()
+                if status["last_seen"] < cutoff and tenant not in self._in_flight
+            ]
+            for tenant in idle:
+                del self._tenants[tenant]
+        return idle
+
+    def due(self) -> list:
+        now = time.time()
+        with self._lock:
+            return [
+                tenant
+                for tenant, status in self._tenants.items()
+                if tenant not in self._in_flight
+                and (
+                    status["last_refresh"] is None
+                    or now - status["last_refresh"] >= self.interval_seconds
+                )
+            ]
+
+    def _loop(self):
+        # A failed refresh is retried on the next tick rather than every interval
+        tick = min(self.interval_seconds, 60)
+        while not self._stop.wait(tick):
+            self.drop_idle()
+            for tenant in self.due():
+                self.submit(tenant)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="refresh-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                tenant: {**status, "in_flight": tenant in self._in_flight}
+                for tenant, status in self._tenants.items()
+            }
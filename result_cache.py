@@ -0,0 +1,141 @@
+"""
+Cache of InventoryCodeInterpreter results.
+
+Entries are keyed by the AST of the code, so whitespace and comments do not
+matter, together with the version of the data the code ran against. Only
+successful runs of code whose output depends on nothing but the data are
+cached: code that reads the clock ("overdue as of today") or draws random
+numbers is always run. Entries expire after RESULT_CACHE_TTL_SECONDS, and
+the least recently used ones are evicted once the cached outputs exceed a
+memory budget.
+"""
+
+import ast
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import RESULT_CACHE_LOOKUPS
+
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "64"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600"))
+# Names, attributes and modules that make an output change on identical data
+VOLATILE_NAMES = frozenset(
+    ("now", "today", "utcnow", "time", "time_ns", "monotonic", "perf_counter")
+    + ("random", "rand", "randn", "randint", "default_rng", "choice", "shuffle", "permutation")
+    + ("sample", "urandom", "uuid1", "uuid4", "secrets")
+)
+# pd.Timestamp("today"), pd.to_datetime("now")
+VOLATILE_STRINGS = frozenset({"now", "today"})
+# DuckDB functions and keywords whose result changes on identical data
+VOLATILE_SQL = re.compile(
+    r"\b(now|today|current_date|current_time|current_timestamp|get_current_time"
+    r"|get_current_timestamp|localtime|localtimestamp|transaction_timestamp"
+    r"|random|setseed|uuid|gen_random_uuid)\b",
+    re.IGNORECASE,
+)
+
+
+def _parse(code: str):
+    try:
+        return ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+
+def normalize_code(code: str):
+    """Return a canonical form of `code`, or None if it does not parse."""
+    tree = _parse(code)
+    return None if tree is None else ast.dump(tree, annotate_fields=False)
+
+
+def is_volatile(tree: ast.AST) -> bool:
+    """Whether the code reads the clock or draws random numbers."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            names = [node.id]
+        elif isinstance(node, ast.Attribute):
+            names = [node.attr]
+        elif isinstance(node, ast.alias):
+            names = node.name.split(".")
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            if node.value.strip().lower() in VOLATILE_STRINGS:
+                return True
+            continue
+        else:
+            continue
+        if any(name in VOLATILE_NAMES for name in names):
+            return True
+    return False
+
+
+def is_volatile_code(code: str) -> bool:
+    """Whether Python `code` reads the clock or draws random numbers."""
+    tree = _parse(code)
+    return tree is not None and is_volatile(tree)
+
+
+def is_volatile_sql(sql: str) -> bool:
+    """Whether a SQL query reads the clock or draws random numbers."""
+    return VOLATILE_SQL.search(sql) is not None
+
+
+class ResultCache:
+    def __init__(
+        self,
+        max_bytes: int = int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+        ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # (workspace, version, code hash) -> (output, stored_at)
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def key(self, code: str, workspace: str, data_version: str):
+        """Cache key of `code` run in `workspace`, or None if it can't be cached."""
+        tree = _parse(code)
+        if tree is None or is_volatile(tree):
+            return None
+        normalized = ast.dump(tree, annotate_fields=False)
+        digest = hashlib.sha256(normalized.encode()).hexdigest()
+        return (workspace, data_version, digest)
+
+    def get(self, key):
+        output = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+                self._nbytes -= len(self._entries.pop(key)[0])
+            elif entry is not None:
+                self._entries.move_to_end(key)
+                output = entry[0]
+        RESULT_CACHE_LOOKUPS.inc(outcome="miss" if output is None else "hit")
+        return output
+
+    def put(self, key, output: str):
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= len(self._entries.pop(key)[0])
+            self._entries[key] = (output, time.time())
+            self._nbytes += len(output)
+            while self._nbytes > self.max_bytes and self._entries:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._nbytes -= len(evicted)
+
+    def invalidate(self, workspace: str = None, keep_version: str = None):
+        """
+        Drop the entries of `workspace` (of every workspace when None), except
+        those computed against `keep_version`.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if (workspace is None or key[0] == workspace) and key[1] != keep_version:
+                    self._nbytes -= len(self._entries.pop(key)[0])
+
+
+RESULT_CACHE = ResultCache()
@@ -0,0 +1,151 @@
+"""
+Small pre-aggregated tables computed after each sync.
+
+A rollup groups a source table by a time bucket and a few dimensions and
+aggregates some measures. As for the views, field names are not fixed, so
+the source, the date column, every dimension and every measure list
+candidates and the first one that works is used: a measure candidate is a
+pandas ``DataFrame.eval`` expression such as ``"quantity * price"``. A
+rollup whose date column or measures can't be found is skipped.
+
+The set of rollups can be replaced with a JSON file of the same structure
+given in ROLLUPS_CONFIG.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+ROLLUPS_CONFIG = os.getenv("ROLLUPS_CONFIG")
+
+_DATE_COLUMNS = ["date", "invoice_date", "purchase_date", "created_at", "createdAt", "issued_at"]
+_AMOUNT_COLUMNS = ["total", "total_amount", "totalAmount", "amount", "total_price", "totalPrice"]
+_QUANTITY_COLUMNS = ["quantity", "qty", "stock", "stock_quantity", "quantity_in_stock"]
+_PRICE_COLUMNS = ["price", "unit_price", "unitPrice", "cost", "purchase_price", "sale_price"]
+
+DEFAULT_ROLLUPS = {
+    "revenue_by_client_month": {
+        "description": "invoiced revenue and invoice count per client and month",
+        "sources": ["invoices_enriched", "invoices"],
+        "date": _DATE_COLUMNS,
+        "freq": "M",
+        "group_by": [["client_name", "client__id", "client_id", "client"]],
+        "measures": {"revenue": (_AMOUNT_COLUMNS, "sum"), "invoices": (["_id"], "count")},
+    },
+    "spend_by_supplier_month": {
+        "description": "purchase spend and purchase count per supplier and month",
+        "sources": ["purchases_enriched", "purchases"],
+        "date": _DATE_COLUMNS,
+        "freq": "M",
+        "group_by": [["supplier_name", "supplier__id", "supplier_id", "supplier"]],
+        "measures": {"spend": (_AMOUNT_COLUMNS, "sum"), "purchases": (["_id"], "count")},
+    },
+    "sales_by_item_month": {
+        "description": "quantity sold and revenue per item and month, from invoice lines",
+        "sources": ["invoice_lines_enriched"],
+        "date": [f"invoice_{column}" for column in _DATE_COLUMNS],
+        "freq": "M",
+        "group_by": [["item_name", "item__id", "item_id", "item"]],
+        "measures": {
+            "quantity": (_QUANTITY_COLUMNS, "sum"),
+            "revenue": (
+                [f"{q} * {p}" for q in _QUANTITY_COLUMNS for p in _PRICE_COLUMNS]
+                + _AMOUNT_COLUMNS,
+                "sum",
+            ),
+        },
+    },
+    "stock_value_by_category": {
+        "description": "items, units in stock and stock value per item category",
+        "sources": ["items"],
+        "group_by": [["category_name", "category", "category__id", "category_id"]],
+        "measures": {
+            "items": (["_id"], "count"),
+            "units": (_QUANTITY_COLUMNS, "sum"),
+            "stock_value": ([f"{q} * {p}" for q in _QUANTITY_COLUMNS for p in _PRICE_COLUMNS], "sum"),
+        },
+    },
+}
+FREQ_NAMES = {"D": "day", "W": "week", "M": "month", "Q": "quarter", "Y": "year"}
+
+
+def load_rollups() -> dict:
+    if not ROLLUPS_CONFIG:
+        return DEFAULT_ROLLUPS
+    with open(ROLLUPS_CONFIG) as f:
+        return json.load(f)
+
+
+ROLLUPS = load_rollups()
+
+
+def rollup_sources(rollup_name: str) -> list:
+    return list(ROLLUPS[rollup_name]["sources"])
+
+
+def _first_column(df: pd.DataFrame, candidates: list):
+    return next((column for column in candidates if column in df.columns), None)
+
+
+def _first_expression(df: pd.DataFrame, candidates: list):
+    for expression in candidates:
+        if expression in df.columns:
+            return df[expression]
+        try:
+            return df.eval(expression, engine="python")
+        except Exception:
+            continue
+    return None
+
+
+def build_rollup(rollup_name: str, tables: dict):
+    """Compute one rollup from `tables` (name -> DataFrame); None if it doesn't apply."""
+    rollup = ROLLUPS[rollup_name]
+    source = next((tables[name] for name in rollup["sources"] if name in tables), None)
+    if source is None or source.empty:
+        return None
+
+    keys = {}
+    if rollup.get("date"):
+        date_column = _first_column(source, rollup["date"])
+        if date_column is None:
+            return None
+        dates = pd.to_datetime(source[date_column], errors="coerce", utc=True, format="mixed")
+        freq = rollup.get("freq", "M")
+        keys[FREQ_NAMES.get(freq, "period")] = (
+            dates.dt.tz_localize(None).dt.to_period(freq).astype(str).where(dates.notna())
+        )
+    for candidates in rollup.get("group_by", []):
+        column = _first_column(source, candidates)
+        if column is not None:
+            keys[column] = source[column].astype(str).where(source[column].notna())
+
+    measures = {}
+    for measure_name, (candidates, aggregation) in rollup["measures"].items():
+        values = _first_expression(source, candidates)
+        if values is None:
+            continue
+        if aggregation not in ("count", "nunique"):
+            values = pd.to_numeric(values, errors="coerce")
+        measures[measure_name] = (values, aggregation)
+    if not measures:
+        return None
+
+    frame = pd.DataFrame({**keys, **{name: values for name, (values, _) in measures.items()}})
+    aggregations = {name: aggregation for name, (_, aggregation) in measures.items()}
+    if keys:
+        result = frame.groupby(list(keys), dropna=False).agg(aggregations).reset_index()
+        return result.sort_values(list(keys)).reset_index(drop=True)
+    return frame.agg(aggregations).to_frame().T
+
+
+def format_rollups(data: dict) -> str:
+    """Describe the rollup tables of `data` for the system prompt."""
+    rollups = [name for name in ROLLUPS if name in data]
+    if not rollups:
+        return "None"
+    return "\n\n".join(
+        f"{name} ({ROLLUPS[name].get('description', '')}) :\n{data[name][1]}"
+        for name in rollups
+    )
@@ -0,0 +1,89 @@
+"""
+Double-buffered table snapshots.
+
+A sync writes a complete new snapshot directory, seeded with hard links to
+the files of the previous one, then publishes it by atomically replacing a
+symlink. Readers resolve the symlink once and keep reading a snapshot that
+is never modified again: every table write goes to a temporary file that
+is renamed into place, so the hard-linked files of older snapshots are
+never touched.
+"""
+
+import os
+import shutil
+import time
+import uuid
+
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "2"))
+# How long a replaced snapshot stays readable: longer than any request, and
+# long enough for other workers to notice the newer one
+SNAPSHOT_GRACE_SECONDS = float(os.getenv("SNAPSHOT_GRACE_SECONDS", "3600"))
+
+
+def create_snapshot(snapshots_dir: str, seed_dir: str = None) -> str:
+    """
+    Create ``<snapshots_dir>/<id>/data`` and return it. The files of
+    `seed_dir`, if given, are hard-linked (or copied) into it.
+    """
+    snapshot_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    data_dir = os.path.join(snapshots_dir, snapshot_id, "data")
+    os.makedirs(data_dir)
+    if seed_dir and os.path.isdir(seed_dir):
+        for entry in os.scandir(seed_dir):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            target = os.path.join(data_dir, entry.name)
+            try:
+                os.link(entry.path, target)
+            except OSError:
+                shutil.copy2(entry.path, target)
+    return data_dir
+
+
+def current_snapshot(link_path: str):
+    """The directory `link_path` points to, or None if nothing was published."""
+    if not os.path.islink(link_path):
+        return None
+    return os.path.realpath(link_path)
+
+
+def publish_snapshot(link_path: str, target: str, snapshots_dir: str):
+    """
+    Point `link_path` to `target` atomically. A plain directory left at
+    `link_path` by an older layout is first moved into `snapshots_dir`.
+    """
+    if os.path.isdir(link_path) and not os.path.islink(link_path):
+        legacy_dir = os.path.join(snapshots_dir, f"legacy-{uuid.uuid4().hex[:8]}")
+        os.makedirs(legacy_dir)
+        os.rename(link_path, os.path.join(legacy_dir, os.path.basename(link_path)))
+    tmp_link = f"{link_path}.{uuid.uuid4().hex[:8]}.tmp"
+    os.symlink(os.path.abspath(target), tmp_link)
+    os.replace(tmp_link, link_path)
+
+
+def prune_snapshots(
+    snapshots_dir: str,
+    keep: int = SNAPSHOT_KEEP,
+    in_use=(),
+    grace_seconds: float = SNAPSHOT_GRACE_SECONDS,
+):
+    """
+    Delete all but the `keep` newest snapshots, never those in `in_use` nor
+    those replaced by a newer snapshot less than `grace_seconds` ago, which
+    requests started before the replacement may still be reading.
+    """
+    in_use = {os.path.realpath(path) for path in in_use}
+    snapshots = sorted(
+        ((entry, entry.stat().st_mtime) for entry in os.scandir(snapshots_dir) if entry.is_dir()),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    now = time.time()
+    for position in range(keep, len(snapshots)):
+        entry = snapshots[position][0]
+        replaced_at = snapshots[position - 1][1] if position else now
+        if now - replaced_at < grace_seconds:
+            continue
+        path = os.path.realpath(entry.path)
+        if not any(path == used or used.startswith(path + os.sep) for used in in_use):
+            shutil.rmtree(entry.path, ignore_errors=True)